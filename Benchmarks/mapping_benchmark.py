@@ -0,0 +1,222 @@
+import os
+import ast
+import sys
+import json
+import time
+import shutil
+import resource
+import argparse
+import subprocess
+import pandas as pd
+from synthetic_catalog import synthetic_footprints, write_synthetic_geotiff
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+DEFAULT_SIZES = [20000, 200000, 2000000]
+DEFAULT_TIMEOUT = 1800  # Seconds before a script run is recorded as 'timeout'
+DEFAULT_TOLERANCE = 1.25  # Slowdown against the baseline that is reported as a regression
+RESULT_MARKER = 'BENCHMARK_RESULT '
+
+STAGES = ['import', 'read', 'geometry', 'aggregation', 'rendering', 'output', 'other']
+
+# Top-level statements are assigned to the first stage whose keywords appear in their source.
+# This is a heuristic: a statement doing several things is counted whole under one stage.
+STAGE_KEYWORDS = [
+    ('output', ('write_html', 'savefig', '.to_csv(', 'write_cog')),
+    ('rendering', ('fig.', 'go.figure', 'plt.', 'show(', '.plot(', 'colorbar', 'scalarmappable', 'raster_to_base64', 'color_map', 'normalize(')),
+    ('geometry', ('transform', 'shapely', 'polygons', 'geodataframe', 'to_crs', 'centroids', 'coords', 'longitude')),
+    ('read', ('read_csv', 'rasterio.open', 'read_ratio_window', 'query(')),
+    ('aggregation', ('!= 0', 'min(', 'max(', 'mean(', 'groupby')),
+]
+
+# name: (script, stage of statements without stage keywords, e.g. a CLI main())
+SCRIPTS = {
+    'coverage_raster': ('Lunar_map_coverage/coverage_raster.py', 'aggregation'),
+    'ratio_pyramid_build': ('Sub_pixel_resolution/ratio_pyramid.py', 'aggregation'),
+    'ratio_pyramid_level': ('Sub_pixel_resolution/ratio_pyramid.py', 'output'),
+    'csv_filteration': ('Sub_pixel_resolution/csv_filteration.py', 'other'),
+    'sub_pixel_plotting': ('Sub_pixel_resolution/sub_pixel_plotting.py', 'other'),
+    'mg_by_si_interactivePlot': ('Ratio_mapping_on_Lunar_map/using_pyhon_script/mg_by_si_py/mg_by_si_interactivePlot.py', 'other'),
+    'al_by_si_interactivePlot': ('Ratio_mapping_on_Lunar_map/using_pyhon_script/al_by_si_py/al_by_si_interactivePlot.py', 'other'),
+    'ca_by_si_interactivePlot': ('Ratio_mapping_on_Lunar_map/using_pyhon_script/ca_by_si_py/ca_by_si_interactivePlot.py', 'other'),
+}
+
+
+def stage_of(statement, source, default_stage):
+    """Benchmark stage of one top-level statement of a script."""
+    if isinstance(statement, (ast.Import, ast.ImportFrom)):
+        return 'import'
+    text = source.lower()
+    for stage, keywords in STAGE_KEYWORDS:
+        if any(keyword in text for keyword in keywords):
+            return stage
+    return default_stage
+
+
+def run_script(script, overrides, argv, default_stage, timings):
+    """Execute a script statement by statement, adding the time spent per stage to ``timings``.
+
+    Module-level ``if`` blocks are entered so that the branch actually taken is timed
+    statement by statement too. Assignments to a name in ``overrides`` (the hard-coded
+    input and output paths) are replaced by the given value right after they run.
+    """
+    with open(script, encoding='utf-8') as f:
+        source = f.read()
+    namespace = {'__name__': '__main__', '__file__': script}
+    sys.path.insert(0, os.path.dirname(script))
+    sys.argv = [script] + argv
+
+    def execute(statements):
+        for statement in statements:
+            if isinstance(statement, ast.If):
+                test = eval(compile(ast.Expression(statement.test), script, 'eval'), namespace)
+                execute(statement.body if test else statement.orelse)
+                continue
+
+            start = time.perf_counter()
+            exec(compile(ast.Module([statement], type_ignores=[]), script, 'exec'), namespace)
+            timings[stage_of(statement, ast.get_source_segment(source, statement), default_stage)] += time.perf_counter() - start
+
+            if isinstance(statement, ast.Assign):
+                for target in statement.targets:
+                    if isinstance(target, ast.Name) and target.id in overrides:
+                        namespace[target.id] = overrides[target.id]
+
+    execute(ast.parse(source, script).body)
+
+
+def folder_size(folder):
+    """Total size in bytes of the files below a folder."""
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(folder) for f in files)
+
+
+def benchmark(name, work_dir, overrides=None, argv=None, timeout=DEFAULT_TIMEOUT):
+    """Run one script in a fresh process inside ``work_dir`` and collect its timings, output size and peak memory."""
+    script, default_stage = SCRIPTS[name]
+    os.makedirs(work_dir, exist_ok=True)
+    command = [sys.executable, os.path.abspath(__file__), 'run-script', os.path.abspath(os.path.join(REPO, script)),
+               '--default_stage', default_stage, '--overrides', json.dumps(overrides or {}), '--'] + (argv or [])
+
+    result = {'script': name, 'status': 'ok'}
+    start = time.perf_counter()
+    try:
+        completed = subprocess.run(command, cwd=work_dir, capture_output=True, text=True, timeout=timeout,
+                                   env={**os.environ, 'MPLBACKEND': 'Agg'})
+    except subprocess.TimeoutExpired:
+        result['status'] = 'timeout'
+        completed = None
+    result['total_s'] = time.perf_counter() - start
+
+    lines = [line for line in (completed.stdout if completed else '').splitlines() if line.startswith(RESULT_MARKER)]
+    if completed is not None and completed.returncode < 0:
+        result['status'] = 'killed'  # Usually the out-of-memory killer
+    elif completed is not None and (completed.returncode != 0 or not lines):
+        result['status'] = 'failed'
+        print(completed.stderr[-2000:], file=sys.stderr)
+    if lines:
+        measured = json.loads(lines[-1][len(RESULT_MARKER):])
+        result.update({f'{stage}_s': seconds for stage, seconds in measured['stages'].items()})
+        result['peak_rss_mb'] = measured['peak_rss_mb']
+    result['output_mb'] = folder_size(work_dir) / 2**20
+    return result
+
+
+def benchmark_size(n_rows, data_dir, work_dir, scripts, tiff_file, timeout=DEFAULT_TIMEOUT):
+    """Run the mapping scripts on one synthetic catalog size, feeding each stage the output of the previous one."""
+    catalog = os.path.join(data_dir, f'synthetic_ratio_{n_rows}.csv')
+    if not os.path.exists(catalog):
+        synthetic_footprints(n_rows).to_csv(catalog, index=False)
+
+    run_dir = os.path.join(work_dir, str(n_rows))
+    if os.path.exists(run_dir):
+        shutil.rmtree(run_dir)
+    store = os.path.join(run_dir, 'ratio_pyramid_build', 'store')
+    grid = os.path.join(run_dir, 'ratio_pyramid_level', 'subpixel_resolutions.csv')
+    filtered = os.path.join(run_dir, 'csv_filteration', 'filtered_subpixel_resolutions.csv')
+
+    runs = {
+        'coverage_raster': dict(argv=[catalog, '--state', 'coverage_state.npz', '--summary', 'coverage_summary.csv', '--geotiff', 'coverage.tif']),
+        'ratio_pyramid_build': dict(argv=['build', catalog, store, '--resolution', '0.1']),
+        'ratio_pyramid_level': dict(argv=['level', store, '--resolution', '0.1', '--output', grid]),
+        'csv_filteration': dict(overrides={'input_csv': grid, 'output_csv': filtered}),
+        'sub_pixel_plotting': dict(overrides={'tiff_file': tiff_file, 'csv_file': filtered}),
+    }
+    for name in SCRIPTS:
+        if name.endswith('interactivePlot'):
+            runs[name] = dict(overrides={'tiff_file': tiff_file, 'csv_file': catalog})
+
+    results = []
+    for name in scripts:
+        result = benchmark(name, os.path.join(run_dir, name), timeout=timeout, **runs[name])
+        result['rows'] = n_rows
+        result['us_per_row'] = result['total_s'] / n_rows * 1e6
+        results.append(result)
+        print(f"{n_rows:>9} rows  {name:<26} {result['status']:<8} {result['total_s']:8.2f} s  {result['output_mb']:9.1f} MB")
+    return results
+
+
+def compare(results, baseline_file, tolerance=DEFAULT_TOLERANCE):
+    """Rows of ``results`` that are slower than the baseline run by more than ``tolerance``."""
+    baseline = pd.read_csv(baseline_file)[['rows', 'script', 'total_s']]
+    merged = results.merge(baseline, on=['rows', 'script'], suffixes=('', '_baseline'))
+    merged['slowdown'] = merged['total_s'] / merged['total_s_baseline']
+    return merged[merged['slowdown'] > tolerance]
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'run-script':
+        # Child process started by benchmark(); the arguments after '--' are passed on to the script
+        separator = sys.argv.index('--')
+        parser = argparse.ArgumentParser()
+        parser.add_argument('command')
+        parser.add_argument('script')
+        parser.add_argument('--default_stage', default='other')
+        parser.add_argument('--overrides', default='{}')
+        args = parser.parse_args(sys.argv[1:separator])
+
+        # The stages timed before a failure are still reported
+        stages = dict.fromkeys(STAGES, 0.0)
+        try:
+            run_script(args.script, json.loads(args.overrides), sys.argv[separator + 1:], args.default_stage, stages)
+        finally:
+            peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # Linux reports KiB
+            print(RESULT_MARKER + json.dumps({'stages': stages, 'peak_rss_mb': peak_rss_mb}))
+        return
+
+    parser = argparse.ArgumentParser(description="Time the mapping scripts on synthetic footprint catalogs of increasing size.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="Catalog sizes in rows.")
+    parser.add_argument('--scripts', type=str, nargs='+', default=list(SCRIPTS), choices=list(SCRIPTS), help="Scripts to run, in pipeline order.")
+    parser.add_argument('--data_dir', type=str, default='./benchmark_data', help="Folder of the synthetic catalogs and base map (generated if missing).")
+    parser.add_argument('--work_dir', type=str, default='./benchmark_runs', help="Folder where the scripts write their outputs.")
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT, help="Seconds allowed per script run.")
+    parser.add_argument('--output', type=str, default='./benchmark_results.csv', help="CSV with one row per catalog size and script.")
+    parser.add_argument('--baseline', type=str, default=None, help="Earlier results CSV to compare against.")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help="Slowdown against the baseline reported as a regression.")
+
+    args = parser.parse_args()
+
+    data_dir, work_dir = os.path.abspath(args.data_dir), os.path.abspath(args.work_dir)
+    os.makedirs(data_dir, exist_ok=True)
+    tiff_file = os.path.join(data_dir, 'synthetic_lunar_basemap.tif')
+    if not os.path.exists(tiff_file):
+        write_synthetic_geotiff(tiff_file)
+
+    results = []
+    for n_rows in args.sizes:
+        results += benchmark_size(n_rows, data_dir, work_dir, args.scripts, tiff_file, args.timeout)
+
+    columns = ['rows', 'script', 'status', 'total_s', 'us_per_row'] + [f'{stage}_s' for stage in STAGES] + ['output_mb', 'peak_rss_mb']
+    results = pd.DataFrame(results).reindex(columns=columns)
+    results.to_csv(args.output, index=False)
+    print(f"Results saved to {args.output}")
+
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance)
+        if len(regressions):
+            print(f"Slower than {args.baseline} by more than {args.tolerance}x:")
+            print(regressions[['rows', 'script', 'total_s_baseline', 'total_s', 'slowdown']].to_string(index=False))
+        else:
+            print(f"No run is slower than {args.baseline} by more than {args.tolerance}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import os
+import sys
+import argparse
+import numpy as np
+import pandas as pd
+import rasterio
+from rasterio.transform import from_origin
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Common'))
+from lunar_common import LUNAR_CRS, LUNAR_RADIUS
+
+# Footprint shape of the CLASS catalog: about 6° along the (polar) track and 0.8° across at the equator
+HALF_LENGTH = 3.0
+HALF_WIDTH = 0.4
+MAX_SKEW = 0.3  # Longitude shift between the leading and trailing edge
+MAX_CENTRE_LAT = 84.0
+
+# Mean and spread of the ratios in coordinate_and_line_intesity_ratio.csv
+RATIOS = {'mg/si': (0.30, 0.08), 'al/si': (0.60, 0.12), 'ca/si': (0.37, 0.08)}
+DEFAULT_ZERO_FRACTION = 0.2  # Rows whose fit failed, written as 0 like the pipeline does
+LAYOUTS = ('ratio', 'coordinates')
+
+
+def synthetic_footprints(n_rows, seed=0, zero_fraction=DEFAULT_ZERO_FRACTION, layout='ratio'):
+    """Random footprints shaped like the CLASS catalog.
+
+    With the 'ratio' layout the columns are those of coordinate_and_line_intesity_ratio.csv
+    (V0_LATITUDE ... V3_LONGITUDE, mg/si, al/si, ca/si), read by the plotting scripts; the
+    'coordinates' layout matches Lunar_map_coverage/coordinates.csv and has no ratios.
+    """
+    rng = np.random.default_rng(seed)
+    lat = rng.uniform(-MAX_CENTRE_LAT, MAX_CENTRE_LAT, n_rows)
+    lon = rng.uniform(-180, 180, n_rows)
+    width = HALF_WIDTH / np.cos(np.radians(lat))
+    skew = rng.uniform(-MAX_SKEW, MAX_SKEW, n_rows) / 2
+
+    # V0 top-left, V1 bottom-left, V2 bottom-right, V3 top-right, as in the catalog
+    latitudes = np.column_stack([lat + HALF_LENGTH, lat - HALF_LENGTH, lat - HALF_LENGTH, lat + HALF_LENGTH])
+    longitudes = np.column_stack([lon - width + skew, lon - width - skew, lon + width - skew, lon + width + skew])
+    longitudes = (longitudes + 180) % 360 - 180
+
+    if layout == 'coordinates':
+        columns = {}
+        for i in range(4):
+            columns[f'V{i} Latitude'] = latitudes[:, i].round(4)
+            columns[f'V{i} Longitude'] = longitudes[:, i].round(4)
+        return pd.DataFrame(columns)
+
+    columns = {f'V{i}_LATITUDE': latitudes[:, i].round(3) for i in range(4)}
+    columns.update({f'V{i}_LONGITUDE': longitudes[:, i].round(3) for i in range(4)})
+    failed = rng.random(n_rows) < zero_fraction
+    for name, (mean, spread) in RATIOS.items():
+        columns[name] = np.where(failed, 0, np.clip(rng.normal(mean, spread, n_rows), 0.01, None)).round(3)
+    return pd.DataFrame(columns)
+
+
+def write_synthetic_geotiff(output_file, width=2880, height=1440, seed=0):
+    """Write a global uint8 base map in the lunar equirectangular CRS, standing in for the WAC mosaic."""
+    rng = np.random.default_rng(seed)
+    y, x = np.ogrid[0:height, 0:width]
+    albedo = 120 + 40 * np.sin(x / width * 6 * np.pi) * np.cos(y / height * 4 * np.pi)
+    albedo = albedo + rng.normal(0, 12, (height, width))
+
+    # A few hundred dark craters so that the image compresses like a real mosaic, not like noise
+    for cx, cy, r in zip(rng.uniform(0, width, 300), rng.uniform(0, height, 300), rng.uniform(3, height / 20, 300)):
+        rows = slice(max(int(cy - 3 * r), 0), min(int(cy + 3 * r) + 1, height))
+        cols = slice(max(int(cx - 3 * r), 0), min(int(cx + 3 * r) + 1, width))
+        albedo[rows, cols] -= 50 * np.exp(-((x[:, cols] - cx) ** 2 + (y[rows] - cy) ** 2) / (2 * r ** 2))
+
+    pixel_size = 2 * np.pi * LUNAR_RADIUS / width
+    transform = from_origin(-np.pi * LUNAR_RADIUS, np.pi / 2 * LUNAR_RADIUS, pixel_size, pixel_size)
+    with rasterio.open(
+        output_file, 'w', driver='GTiff', height=height, width=width, count=1, dtype='uint8',
+        crs=LUNAR_CRS.to_wkt(), transform=transform, compress='deflate', tiled=True,
+    ) as dst:
+        dst.write(np.clip(albedo, 0, 255).astype(np.uint8), 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic CLASS footprint catalogs and a lunar base map GeoTIFF.")
+    parser.add_argument('rows', type=int, nargs='+', help="Catalog sizes to generate (e.g. 20000 200000 2000000).")
+    parser.add_argument('--output_dir', type=str, default='./benchmark_data', help="Folder for the generated files.")
+    parser.add_argument('--layout', choices=LAYOUTS, default='ratio', help="Column layout of the catalog.")
+    parser.add_argument('--zero_fraction', type=float, default=DEFAULT_ZERO_FRACTION, help="Fraction of rows with zero ratios.")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed.")
+    parser.add_argument('--tiff_size', type=int, nargs=2, default=(2880, 1440), metavar=('WIDTH', 'HEIGHT'), help="Size of the base map in pixels.")
+
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    for n_rows in args.rows:
+        csv_file = os.path.join(args.output_dir, f'synthetic_{args.layout}_{n_rows}.csv')
+        synthetic_footprints(n_rows, args.seed, args.zero_fraction, args.layout).to_csv(csv_file, index=False)
+        print(f"{n_rows} footprints saved to {csv_file}")
+
+    tiff_file = os.path.join(args.output_dir, 'synthetic_lunar_basemap.tif')
+    write_synthetic_geotiff(tiff_file, *args.tiff_size, seed=args.seed)
+    print(f"Base map saved to {tiff_file}")
+
+
+if __name__ == "__main__":
+    main()
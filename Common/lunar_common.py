@@ -0,0 +1,219 @@
+import io
+import os
+import re
+import hashlib
+import numpy as np
+import pandas as pd
+from pyproj import CRS
+
+# Set the environment variable to ignore celestial body mismatches
+os.environ["PROJ_IGNORE_CELESTIAL_BODY"] = "YES"
+
+# Same lunar equirectangular CRS as the WAC base map used by the mapping scripts
+LUNAR_RADIUS = 1737400
+LUNAR_CRS = CRS.from_proj4("+proj=eqc +lat_ts=0 +lon_0=0 +a=1737400 +b=1737400 +units=m")
+METRES_PER_DEGREE = np.pi / 180 * LUNAR_RADIUS
+
+# Vertex columns appear as "V0 Latitude" (coordinates.csv), "V0_LATITUDE" (ratio CSV) or "V0_lat" (line_intensities_calculation.py)
+LAT_PATTERN = re.compile(r"^V([0-3])[ _](lat|latitude)$", re.IGNORECASE)
+LON_PATTERN = re.compile(r"^V([0-3])[ _](lon|long|longitude)$", re.IGNORECASE)
+DIGEST_BYTES = 4096  # Catalog bytes before the resume offset that must be unchanged
+
+
+# Global grids
+
+def grid_shape(resolution):
+    """Number of (rows, columns) of a global north-up grid with cell edges on multiples of the resolution."""
+    return int(round(180 / resolution)), int(round(360 / resolution))
+
+
+def grid_layout(resolution, origin=None):
+    """Rows, columns and the centre (lat, lon) of the north-west cell of a global grid.
+
+    ``origin`` is the (lat, lon) centre of any one cell. The default, half a cell, puts the
+    cell edges on multiples of the resolution so that the grid spans exactly -90..90 and
+    -180..180; other origins shift the grid, with the rows that are needed to cover both poles.
+    """
+    lat0, lon0 = origin if origin is not None else (resolution / 2, resolution / 2)
+    north = lat0 + np.floor((90 + resolution / 2 - lat0) / resolution - 1e-9) * resolution
+    south = lat0 + np.ceil((-90 - resolution / 2 - lat0) / resolution + 1e-9) * resolution
+    west = lon0 + np.ceil((-180 - resolution / 2 - lon0) / resolution + 1e-9) * resolution
+    n_rows, n_cols = int(round((north - south) / resolution)) + 1, int(round(360 / resolution))
+    return n_rows, n_cols, north, west
+
+
+def grid_transform(resolution, origin=None):
+    """Affine transform of a global north-up grid in lunar equirectangular metres."""
+    from rasterio.transform import from_origin
+
+    _, _, north, west = grid_layout(resolution, origin)
+    pixel_size = resolution * METRES_PER_DEGREE
+    return from_origin((west - resolution / 2) * METRES_PER_DEGREE, (north + resolution / 2) * METRES_PER_DEGREE, pixel_size, pixel_size)
+
+
+def infer_grid_origin(latitudes, longitudes, resolution):
+    """Centre (lat, lon) of one cell of the grid that the given cell centres lie on.
+
+    The position of the centres within a cell is averaged on the circle, so coordinates
+    rounded in a CSV still give the grid they were computed on. Without any centre the
+    default grid is returned.
+    """
+    origin = []
+    for values in (latitudes, longitudes):
+        steps = np.asarray(values, dtype=float) / resolution
+        steps = steps[np.isfinite(steps)]
+        if len(steps) == 0:
+            origin.append(resolution / 2)
+            continue
+        phase = np.angle(np.exp(2j * np.pi * steps).mean()) / (2 * np.pi) % 1
+        origin.append(float(round(phase * resolution, 6)))
+    return tuple(origin)
+
+
+def cell_rows_cols(latitudes, longitudes, resolution, origin=None):
+    """Row (from the north) and column of the grid cell whose centre is nearest to each point."""
+    n_rows, n_cols, north, west = grid_layout(resolution, origin)
+    latitudes, longitudes = np.asarray(latitudes, dtype=float), np.asarray(longitudes, dtype=float)
+    rows = np.clip(np.rint((north - latitudes) / resolution), 0, n_rows - 1).astype(np.int64)
+    cols = np.rint(((longitudes - west) % 360) / resolution).astype(np.int64) % n_cols
+    return rows, cols
+
+
+def check_unique_cells(rows, cols, n_cols):
+    """Raise if two points fall into the same grid cell, where one would silently overwrite the other."""
+    cells = rows * n_cols + cols
+    n_duplicates = len(cells) - len(np.unique(cells))
+    if n_duplicates:
+        raise ValueError(
+            f"{n_duplicates} rows fall into a grid cell that is already taken; "
+            "check that --resolution and --grid_origin match the grid of the input"
+        )
+
+
+# Footprints
+
+def vertex_columns(columns):
+    """Return the V0-V3 latitude and longitude column names found in a footprint table."""
+    lat_cols, lon_cols = {}, {}
+    for col in columns:
+        lat_match = LAT_PATTERN.match(col.strip())
+        lon_match = LON_PATTERN.match(col.strip())
+        if lat_match:
+            lat_cols[int(lat_match.group(1))] = col
+        elif lon_match:
+            lon_cols[int(lon_match.group(1))] = col
+
+    if len(lat_cols) != 4 or len(lon_cols) != 4:
+        raise KeyError(f"Expected V0-V3 latitude/longitude columns, found: {list(columns)}")
+
+    return [lat_cols[i] for i in range(4)], [lon_cols[i] for i in range(4)]
+
+
+def footprint_vertices(table):
+    """Return (latitudes, longitudes) arrays of shape (N, 4), longitudes unwrapped across the antimeridian."""
+    lat_cols, lon_cols = vertex_columns(table.columns)
+    latitudes = table[lat_cols].to_numpy(dtype=float)
+    longitudes = (table[lon_cols].to_numpy(dtype=float) + 180) % 360 - 180
+
+    # Footprints straddling +-180 are shifted east so that they stay a single small quadrilateral
+    crossing = (longitudes.max(axis=1) - longitudes.min(axis=1)) > 180
+    longitudes[crossing] = np.where(longitudes[crossing] < 0, longitudes[crossing] + 360, longitudes[crossing])
+
+    return latitudes, longitudes
+
+
+def footprint_rings(latitudes, longitudes):
+    """Return closed (N, 7) lon/lat rings; footprints enclosing a pole are closed along the pole."""
+    # Unwrap the longitudes edge by edge so that no edge jumps by more than 180 degrees
+    steps = (np.diff(longitudes, axis=1, append=longitudes[:, :1]) + 180) % 360 - 180
+    lon = longitudes[:, :1] + np.concatenate([np.zeros((len(longitudes), 1)), np.cumsum(steps, axis=1)], axis=1)
+    lat = np.concatenate([latitudes, latitudes[:, :1]], axis=1)
+
+    # Rings winding once around the globe contain a pole: go up to it at the end longitude and back down at the start
+    encloses = np.abs(lon[:, 4] - lon[:, 0]) > 180
+    pole = np.where(latitudes.mean(axis=1) > 0, 90.0, -90.0)
+    ring_lon = np.column_stack([lon, lon[:, 4], np.where(encloses, lon[:, 0], lon[:, 4])])
+    ring_lat = np.column_stack([lat, np.where(encloses, pole, lat[:, 4]), np.where(encloses, pole, lat[:, 4])])
+    return ring_lat, ring_lon
+
+
+def footprint_spans(ring_lat, ring_lon, resolution):
+    """Return (footprint, row, first column, last column) runs of cells whose centre lies inside a footprint ring."""
+    n_rows, n_cols = grid_shape(resolution)
+    row0 = np.clip(np.ceil((90 - ring_lat.max(axis=1)) / resolution - 0.5).astype(np.int64), 0, n_rows)
+    row1 = np.clip(np.floor((90 - ring_lat.min(axis=1)) / resolution - 0.5).astype(np.int64), -1, n_rows - 1)
+    heights = np.maximum(row1 - row0 + 1, 0)
+
+    owner = np.repeat(np.arange(len(ring_lat)), heights)
+    rows = row0[owner] + np.arange(heights.sum()) - np.repeat(np.cumsum(heights) - heights, heights)
+    y = (90 - (rows + 0.5) * resolution)[:, None]
+
+    # Even-odd scanline: sorted crossings of the row's centre line with the ring edges pair up into runs
+    lat, lon = ring_lat[owner], ring_lon[owner]
+    next_lat, next_lon = np.roll(lat, -1, axis=1), np.roll(lon, -1, axis=1)
+    crosses = (lat <= y) != (next_lat <= y)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x = np.sort(np.where(crosses, lon + (y - lat) * (next_lon - lon) / (next_lat - lat), np.nan), axis=1)
+
+    starts, ends = x[:, 0:6:2].ravel(), x[:, 1:7:2].ravel()
+    owner, rows = np.repeat(owner, 3), np.repeat(rows, 3)
+    valid = np.isfinite(starts) & np.isfinite(ends)
+    first = np.ceil((starts[valid] + 180) / resolution - 0.5).astype(np.int64)
+    last = np.floor((ends[valid] + 180) / resolution - 0.5).astype(np.int64)
+    owner, rows = owner[valid], rows[valid]
+    keep = first <= last
+    owner, rows, first, last = owner[keep], rows[keep], first[keep], last[keep]
+
+    # Bring unwrapped runs back to [0, n_cols) and split the ones crossing the +-180 seam
+    shift = np.floor_divide(first, n_cols) * n_cols
+    first, last = first - shift, last - shift
+    split = last >= n_cols
+    owner = np.concatenate([owner, owner[split]])
+    rows = np.concatenate([rows, rows[split]])
+    first = np.concatenate([first, np.zeros(split.sum(), dtype=np.int64)])
+    last = np.concatenate([np.where(split, n_cols - 1, last), np.minimum(last[split] - n_cols, n_cols - 1)])
+
+    return owner, rows, first, last
+
+
+# Catalog CSVs
+
+def read_catalog(csv_file):
+    """Read a footprint CSV, falling back to latin1 like the mapping scripts."""
+    try:
+        return pd.read_csv(csv_file, encoding="utf-8")
+    except UnicodeDecodeError:
+        return pd.read_csv(csv_file, encoding="latin1")
+
+
+def tail_digest(f, offset):
+    """Digest of the bytes just before ``offset`` of an open catalog, used to detect rewritten files."""
+    f.seek(max(offset - DIGEST_BYTES, 0))
+    return hashlib.sha1(f.read(offset - f.tell())).hexdigest()
+
+
+def read_new_rows(csv_file, offset, digest=None):
+    """Read the rows appended to a catalog CSV after byte ``offset``.
+
+    Only the header and the new bytes are parsed. A partly written last line is left for
+    the next run. When ``digest`` is given, the bytes before ``offset`` must still be the
+    ones read last time. Returns the rows, the offset to resume from and its digest.
+    """
+    with open(csv_file, 'rb') as f:
+        header = f.readline()
+        if offset > os.fstat(f.fileno()).st_size:
+            raise ValueError(f"{csv_file} is shorter than when it was last read; it was truncated or rewritten")
+        start = max(offset, f.tell())
+        if digest is not None and tail_digest(f, start) != digest:
+            raise ValueError(f"{csv_file} was rewritten since it was last read")
+        f.seek(start)
+        new_bytes = f.read()
+        end = start + new_bytes.rfind(b'\n') + 1
+        new_digest = tail_digest(f, end)
+
+    data = header + new_bytes[:end - start]
+    try:
+        table = pd.read_csv(io.BytesIO(data), encoding="utf-8")
+    except UnicodeDecodeError:
+        table = pd.read_csv(io.BytesIO(data), encoding="latin1")
+    return table, end, new_digest
@@ -0,0 +1,206 @@
+import os
+import re
+import sys
+import argparse
+import numpy as np
+import pandas as pd
+import rasterio
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Common'))
+from lunar_common import LUNAR_CRS, cell_rows_cols, check_unique_cells, grid_layout, grid_transform, infer_grid_origin
+
+DEFAULT_TABLE = 'LunarSurfaceComposition - ElementalCompoition.csv'  # Rock groups by molar percentage ranges
+DEFAULT_CHUNK_SIZE = 100000  # Cells classified at once; small enough for the temporaries to stay in cache
+DEFAULT_TOLERANCE = 2.0  # Half-width (percent) around single-valued entries of the mineral tables; exact values would never match
+NODATA = -1  # Group code of unclassified cells
+
+RANGE_PATTERN = re.compile(r"^\s*(\d*\.?\d+)\s*-\s*(\d*\.?\d+)\s*$")  # "18.0 - 20.0", "0.00-.87"
+NAME_COLUMNS = ('Rock Name', 'Mineral Name')
+IGNORED_COLUMNS = ('Formula',)
+
+
+def parse_interval(value, tolerance=DEFAULT_TOLERANCE):
+    """Turn a table entry like '18.0 - 20.0' or a single value like '24.74' into (low, high)."""
+    match = RANGE_PATTERN.match(str(value))
+    if match:
+        low, high = float(match.group(1)), float(match.group(2))
+        return min(low, high), max(low, high)
+    number = float(value)
+    return number - tolerance, number + tolerance
+
+
+def load_group_table(table_file, tolerance=DEFAULT_TOLERANCE):
+    """Parse a composition table into group names, element names and a (groups, elements, 2) interval array."""
+    table = pd.read_csv(table_file, dtype=str)
+    name_column = next(col for col in table.columns if col.strip() in NAME_COLUMNS)
+    element_columns = [col for col in table.columns if col != name_column and col.strip() not in IGNORED_COLUMNS]
+
+    names = [name.strip() for name in table[name_column]]
+    elements = [col.strip().replace('-range', '').lower() for col in element_columns]
+    intervals = np.array(
+        [[parse_interval(value, tolerance) for value in row] for row in table[element_columns].itertuples(index=False)],
+        dtype=float,
+    )
+    return names, elements, intervals
+
+
+def abundance_columns(data, elements, si_percent=None):
+    """Return an (N, elements) abundance array; elements missing from the data are NaN and left unconstrained.
+
+    Abundances are read from columns named after the element (e.g. 'al' or 'Al'). When
+    ``si_percent`` is given, ratio columns such as 'al/si' or 'al/si_avg' are scaled by the
+    silicon abundance instead.
+    """
+    lookup = {col.strip().lower(): col for col in data.columns}
+    values = np.full((len(data), len(elements)), np.nan)
+    for i, element in enumerate(elements):
+        if element in lookup:
+            values[:, i] = data[lookup[element]].to_numpy(dtype=float)
+        elif si_percent is not None:
+            ratio = lookup.get(f'{element}/si', lookup.get(f'{element}/si_avg'))
+            if element == 'si':
+                values[:, i] = si_percent
+            elif ratio is not None:
+                values[:, i] = data[ratio].to_numpy(dtype=float) * si_percent
+    return values
+
+
+def rank_groups(key, top_k):
+    """Indices of the ``top_k`` smallest keys of every row, in increasing order (ties keep the table order)."""
+    if top_k == 1:
+        return key.argmin(axis=1)[:, None]
+    if top_k < key.shape[1]:
+        candidates = np.sort(np.argpartition(key, top_k - 1, axis=1)[:, :top_k], axis=1)
+    else:
+        candidates = np.broadcast_to(np.arange(key.shape[1]), key.shape)
+    order = np.argsort(np.take_along_axis(key, candidates, axis=1), axis=1, kind='stable')
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+def classify(values, intervals, top_k=1, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Assign every row of ``values`` to the groups whose intervals contain it.
+
+    Groups are ranked by how far the row lies outside their intervals (0 means inside
+    all constrained elements); exact matches are ordered by closeness to the interval
+    centres. Returns the ranked group codes (N, top_k), which are NODATA where the group
+    is not an exact match, the distances of those groups and the number of exact matches.
+    """
+    # Work in (groups, rows) layout, so that every operation runs along the long row axis
+    low, high = intervals[:, :, 0], intervals[:, :, 1]
+    inverse_width = 1 / np.maximum(high - low, 1e-6)
+    centre = (low + high) / 2
+    n_groups = intervals.shape[0]
+    top_k = min(top_k, n_groups)
+
+    # Elements without any value in the input constrain nothing and are skipped altogether
+    used = np.flatnonzero(~np.isnan(values).all(axis=0))
+
+    codes = np.full((len(values), top_k), NODATA, dtype=np.int16)
+    distances = np.full((len(values), top_k), np.nan, dtype=np.float32)
+    n_matches = np.zeros(len(values), dtype=np.int16)
+
+    for start in range(0, len(values), chunk_size):
+        chunk = values[start:start + chunk_size].T
+        distance = np.zeros((n_groups, chunk.shape[1]))
+        offset = np.zeros_like(distance)
+        below, above = np.empty_like(distance), np.empty_like(distance)
+        n_measured = np.zeros(chunk.shape[1])
+
+        for e in used:
+            v = chunk[e:e + 1]
+            measured_e = ~np.isnan(v)  # Missing values do not constrain the match
+
+            # Distance outside the interval, in interval widths
+            np.subtract(low[:, e:e + 1], v, out=below)
+            np.subtract(v, high[:, e:e + 1], out=above)
+            np.maximum(below, above, out=below)
+            np.maximum(below, 0, out=below)
+            below *= inverse_width[:, e:e + 1]
+            np.add(distance, below, out=distance, where=measured_e)
+
+            # Distance to the interval centre, which ranks the exact matches
+            np.subtract(v, centre[:, e:e + 1], out=above)
+            np.abs(above, out=above)
+            above *= inverse_width[:, e:e + 1]
+            np.add(offset, above, out=offset, where=measured_e)
+            n_measured += measured_e[0]
+        offset /= np.maximum(n_measured, 1)
+
+        # Exact matches (offset <= 0.5) always rank before groups the row falls outside of
+        order = rank_groups(np.where(distance > 0, 1 + distance, offset).T, top_k)
+        best = np.take_along_axis(distance.T, order, axis=1)
+        measured = (n_measured > 0)[:, None]  # Rows without any measured element stay unclassified
+        matched = (best == 0) & measured
+
+        codes[start:start + chunk_size] = np.where(matched, order, NODATA)
+        distances[start:start + chunk_size] = np.where(measured, best, np.nan)
+        n_matches[start:start + chunk_size] = np.where(measured[:, 0], (distance == 0).sum(axis=0), 0)
+
+    return codes, distances, n_matches
+
+
+def write_categorical_geotiff(latitudes, longitudes, codes, names, resolution, output_file, origin=None):
+    """Place group codes of grid cell centres into a global int16 GeoTIFF with the group names as tags.
+
+    Each cell centre goes to the nearest cell of the grid with a cell centred on ``origin``
+    (inferred from the centres by default); two centres in one cell raise a ValueError.
+    """
+    origin = origin or infer_grid_origin(latitudes, longitudes, resolution)
+    n_rows, n_cols, _, _ = grid_layout(resolution, origin)
+    grid = np.full((n_rows, n_cols), NODATA, dtype=np.int16)
+    rows, cols = cell_rows_cols(latitudes, longitudes, resolution, origin)
+    check_unique_cells(rows, cols, n_cols)
+    grid[rows, cols] = codes
+
+    transform = grid_transform(resolution, origin)
+    with rasterio.open(
+        output_file, 'w', driver='GTiff', height=n_rows, width=n_cols, count=1, dtype='int16',
+        crs=LUNAR_CRS.to_wkt(), transform=transform, nodata=NODATA, compress='deflate', tiled=True,
+    ) as dst:
+        dst.write(grid, 1)
+        dst.set_band_description(1, 'group')
+        dst.update_tags(1, **{str(code): name for code, name in enumerate(names)})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Classify grid cells or footprints into lunar rock groups.")
+    parser.add_argument('input_csv', type=str, help="CSV with element abundances (molar %%) or {el}/si ratios.")
+    parser.add_argument('--table', type=str, default=DEFAULT_TABLE, help="Composition table (ElementalCompoition, MolarPercent or WeightPrecent CSV).")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help="Half-width in percent around single-valued table entries (mineral tables); ranges are used as given.")
+    parser.add_argument('--si_percent', type=float, default=None, help="Silicon abundance used to turn {el}/si ratios into abundances.")
+    parser.add_argument('--top_k', type=int, default=1, help="Number of ranked groups written per row.")
+    parser.add_argument('--chunk_size', type=int, default=DEFAULT_CHUNK_SIZE, help="Rows classified at once.")
+    parser.add_argument('--output', type=str, default='./composition_groups.csv', help="Output CSV with the assigned groups.")
+    parser.add_argument('--geotiff', type=str, default=None, help="Also write a categorical GeoTIFF (needs latitude/longitude cell centres).")
+    parser.add_argument('--resolution', type=float, default=0.1, help="Grid cell size of the input in degrees, for --geotiff.")
+    parser.add_argument('--grid_origin', type=float, nargs=2, default=None, metavar=('LAT', 'LON'), help="Centre of any one cell, for --geotiff (default: inferred from the input).")
+
+    args = parser.parse_args()
+
+    names, elements, intervals = load_group_table(args.table, args.tolerance)
+    data = pd.read_csv(args.input_csv)
+    values = abundance_columns(data, elements, args.si_percent)
+    used = [el for el, measured in zip(elements, ~np.isnan(values).all(axis=0)) if measured]
+    print(f"Classifying {len(data)} rows into {len(names)} groups using {', '.join(used) or 'no elements'}")
+
+    codes, distances, n_matches = classify(values, intervals, args.top_k, args.chunk_size)
+
+    labels = np.array(names + ['unclassified'])
+    for k in range(codes.shape[1]):
+        suffix = '' if k == 0 else f'_{k + 1}'
+        data[f'group{suffix}'] = labels[codes[:, k]]
+        data[f'group_distance{suffix}'] = distances[:, k]
+    data['n_matches'] = n_matches
+    data.to_csv(args.output, index=False)
+    print(f"Groups saved to {args.output}")
+
+    if args.geotiff:
+        write_categorical_geotiff(
+            data['latitude'].to_numpy(dtype=float), data['longitude'].to_numpy(dtype=float),
+            codes[:, 0], names, args.resolution, args.geotiff, args.grid_origin,
+        )
+        print(f"Categorical map saved to {args.geotiff}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,7 @@ from scipy.optimize import curve_fit
 from scipy.stats import chisquare
 import numpy as np
 import subprocess
+from spectral_cube import SpectralCube
 
 # Function to check whether it is night-time (background) or day-time data
 def isBG(fits_file):
@@ -52,14 +53,35 @@ def main(fits_directory, compiled_folder):
         i += 1
 
 
+# Same grouping as main, reading the spectra from a cube written by spectral_cube.py.
+# Every run of consecutive background spectra is co-added from the prefix sums and written
+# where the adder code would put it.
+def main_cube(cube_dir, compiled_folder):
+    cube = SpectralCube(cube_dir)
+    output_dir = os.path.join(compiled_folder, "L1_ADDED_FILES_TIME")
+    os.makedirs(output_dir, exist_ok=True)
+
+    background = cube.meta['SOLARANG'].to_numpy(dtype=float) > 90.0
+    edges = np.diff(np.concatenate([[0], background.astype(np.int8), [0]]))
+    for start, stop in zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)):
+        combined_file = cube.write_pha(start, stop, os.path.join(output_dir, cube.range_name(start, stop)))
+        print(f"{stop - start} background spectra added into {combined_file}")
+
+
 # Entry point
 if __name__ == "__main__":
     import argparse
 
     parser = argparse.ArgumentParser(description="Process FITS files with Gaussian fitting and Chi-square check.")
-    parser.add_argument("--fits_directory", "-d", required=True, help="Path to directory containing FITS files.")
+    parser.add_argument("--fits_directory", "-d", help="Path to directory containing FITS files.")
+    parser.add_argument("--cube", default=None, help="Cube directory written by spectral_cube.py, read instead of --fits_directory.")
     parser.add_argument("--compiled_folder", "-c", required=True, help="Path to folder to store compiled FITS files.")
 
     args = parser.parse_args()
 
-    main(args.fits_directory, args.compiled_folder)
+    if args.cube:
+        main_cube(args.cube, args.compiled_folder)
+    elif args.fits_directory:
+        main(args.fits_directory, args.compiled_folder)
+    else:
+        parser.error("one of --fits_directory or --cube is required")
@@ -4,7 +4,10 @@ from astropy.io import fits
 from scipy.optimize import curve_fit
 from scipy.stats import chisquare
 import numpy as np
+import pandas as pd
 import subprocess
+from spectral_cube import SpectralCube
+from fits_prefetch import FitsPrefetcher, read_fits, DEFAULT_PREFETCH
 
 # Gaussian fitting function
 def three_gaussians(x, a1, b1, c1, a2, b2, c2, a3, b3, c3):
@@ -41,40 +44,54 @@ def gauss_fit_chi2(channel, count):
     return chi2
 
 
-# Function to process a single FITS file
-def process_fits_file(fits_file, compiled_folder):
-    with fits.open(fits_file) as hdul:
-        data = hdul[1].data
-        channel = data["channel"] * 13.5 / 1000  # Convert to keV
-        count = data["counts"]
+# Function to process a single FITS file, optionally already read by a FitsPrefetcher
+def process_fits_file(fits_file, compiled_folder, prefetched=None):
+    data = (prefetched or read_fits(fits_file)).data
+    channel = data["channel"] * 13.5 / 1000  # Convert to keV
+    count = data["counts"]
+
+    chi2 = gauss_fit_chi2(channel, count)
+
+    if chi2 is None:
+        print(f"Failed to fit file: {fits_file}")
+        return False, chi2
 
-        chi2 = gauss_fit_chi2(channel, count)
+    print(f"File: {fits_file}, Chi-Square: {chi2}")
 
-        if chi2 is None:
-            print(f"Failed to fit file: {fits_file}")
-            return False, chi2
+    if 0.8 <= chi2 <= 2:
+        # Extract timestamp from the filename
+        filename = os.path.basename(fits_file)
+        start_time = filename.split("_")[3]  # Extract start time (YYYYMMDDThhmmssmse)
+        year, month, day = start_time[:4], start_time[4:6], start_time[6:8]
 
-        print(f"File: {fits_file}, Chi-Square: {chi2}")
+        # Create destination folder
+        output_folder = os.path.join(compiled_folder, year, month, day)
+        os.makedirs(output_folder, exist_ok=True)
 
-        if 0.8 <= chi2 <= 2:
-            # Extract timestamp from the filename
-            filename = os.path.basename(fits_file)
-            start_time = filename.split("_")[3]  # Extract start time (YYYYMMDDThhmmssmse)
-            year, month, day = start_time[:4], start_time[4:6], start_time[6:8]
+        # Move the file
+        shutil.copy(fits_file, output_folder)
+        print(f"File {fits_file} moved to {output_folder}")
+        return True, chi2
 
-            # Create destination folder
-            output_folder = os.path.join(compiled_folder, year, month, day)
-            os.makedirs(output_folder, exist_ok=True)
+    return False, chi2
 
-            # Move the file
-            shutil.copy(fits_file, output_folder)
-            print(f"File {fits_file} moved to {output_folder}")
-            return True, chi2
+# Function to fit a spectrum held in memory (e.g. a cube row or a co-added range)
+def process_spectrum(channel, count, name):
+    chi2 = gauss_fit_chi2(channel, count)
 
+    if chi2 is None:
+        print(f"Failed to fit spectrum: {name}")
         return False, chi2
 
+    print(f"Spectrum: {name}, Chi-Square: {chi2}")
+    return 0.8 <= chi2 <= 2, chi2
+
+
 # Function to check whether it is night-time (background) or day-time data
-def isBG(fits_file):
+def isBG(fits_file, prefetched=None):
+    if prefetched is not None:
+        return prefetched.header["SOLARANG"] > 90.0
+
     with fits.open(fits_file) as hdul:
         header = hdul[1].header
         solar_ang = header["SOLARANG"]
@@ -104,21 +121,28 @@ def add_fits_files(file_list, output_dir, fits_directory):
     return combined_file_path
 
 
-def main(fits_directory, compiled_folder):
+def main(fits_directory, compiled_folder, prefetch=DEFAULT_PREFETCH):
     fits_files = sorted([os.path.join(fits_directory, f) for f in os.listdir(fits_directory) if f.endswith(".fits")])
     for i in fits_files:
         print(i.split('/')[-1])
 
+    # The next files are read on background threads while the current one is fitted
+    with FitsPrefetcher(fits_files, prefetch=prefetch) as reader:
+        _main_loop(fits_files, compiled_folder, reader)
+
+
+def _main_loop(fits_files, compiled_folder, reader):
     i = 0
     while i < len(fits_files):
+        reader.discard_before(i)
         fits_file = fits_files[i]
 
-        if isBG(fits_file): #checks if its a bg file and ignores
+        if isBG(fits_file, reader[i]): #checks if its a bg file and ignores
             i += 1
             continue
 
         # Try processing a single file
-        success, chi2 = process_fits_file(fits_file, compiled_folder)
+        success, chi2 = process_fits_file(fits_file, compiled_folder, reader[i])
 
         if not success and chi2 is not None:
             # Start adding contiguous files
@@ -132,7 +156,7 @@ def main(fits_directory, compiled_folder):
                 # Try processing the combined file
                 success, chi2 = process_fits_file(combined_file, compiled_folder)
 
-                if j+1 < min(i + 12, len(fits_files)) and isBG(fits_files[j+1]): #Break if a bg file comes in between
+                if j+1 < min(i + 12, len(fits_files)) and isBG(fits_files[j+1], reader[j+1]): #Break if a bg file comes in between
                     break
 
                 if success:
@@ -149,14 +173,71 @@ def main(fits_directory, compiled_folder):
         i += 1
 
 
+# Same selection as main, reading the spectra from a cube written by spectral_cube.py.
+# Contiguous spectra are co-added from the prefix sums instead of through the adder code,
+# and the accepted index ranges are saved to compiled_ranges.csv instead of copying files.
+def main_cube(cube_dir, compiled_folder):
+    cube = SpectralCube(cube_dir)
+    n_spectra = len(cube)
+    accepted = []
+
+    i = 0
+    while i < n_spectra:
+        if cube.is_background(i): #checks if its a bg spectrum and ignores
+            i += 1
+            continue
+
+        # Try processing a single spectrum
+        success, chi2 = process_spectrum(cube.channel, cube.counts[i], cube.meta['file'].iat[i])
+        if success:
+            accepted.append((i, i + 1, chi2))
+
+        if not success and chi2 is not None:
+            # Start adding contiguous spectra
+            print(f"Chi-square > 2 for spectrum: {cube.meta['file'].iat[i]}, attempting to add contiguous spectra...")
+
+            for j in range(i + 1, min(i + 12, n_spectra)):  # Limit to a maximum of 12 spectra
+                success, chi2 = process_spectrum(cube.channel, cube.coadd(i, j + 1), cube.range_name(i, j + 1))
+                if success:
+                    accepted.append((i, j + 1, chi2))
+
+                if j+1 < min(i + 12, n_spectra) and cube.is_background(j+1): #Break if a bg spectrum comes in between
+                    break
+
+                if success:
+                    print(f"Successfully processed combined spectrum: {cube.range_name(i, j + 1)}")
+                    i = j  # Skip to the last spectrum in the batch
+                    break
+
+            if not success:
+                print(f"Failed to process even after adding up to 12 spectra: {cube.meta['file'].iat[i]}")
+
+        i += 1
+
+    ranges = pd.DataFrame(accepted, columns=['start', 'stop', 'chi2'])
+    ranges['start_time'] = cube.meta['start_time'].to_numpy()[ranges['start']]
+    ranges['end_time'] = cube.meta['end_time'].to_numpy()[ranges['stop'] - 1]
+    os.makedirs(compiled_folder, exist_ok=True)
+    ranges_file = os.path.join(compiled_folder, 'compiled_ranges.csv')
+    ranges.to_csv(ranges_file, index=False)
+    print(f"{len(ranges)} accepted spectra and co-added ranges saved to {ranges_file}")
+
+
 # Entry point
 if __name__ == "__main__":
     import argparse
 
     parser = argparse.ArgumentParser(description="Process FITS files with Gaussian fitting and Chi-square check.")
-    parser.add_argument("--fits_directory", "-d", required=True, help="Path to directory containing FITS files.")
+    parser.add_argument("--fits_directory", "-d", help="Path to directory containing FITS files.")
+    parser.add_argument("--cube", default=None, help="Cube directory written by spectral_cube.py, read instead of --fits_directory.")
     parser.add_argument("--compiled_folder", "-c", required=True, help="Path to folder to store compiled FITS files.")
+    parser.add_argument("--prefetch", type=int, default=DEFAULT_PREFETCH, help="Number of FITS files read ahead on background threads.")
 
     args = parser.parse_args()
 
-    main(args.fits_directory, args.compiled_folder)
+    if args.cube:
+        main_cube(args.cube, args.compiled_folder)
+    elif args.fits_directory:
+        main(args.fits_directory, args.compiled_folder, args.prefetch)
+    else:
+        parser.error("one of --fits_directory or --cube is required")
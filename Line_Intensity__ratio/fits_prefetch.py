@@ -0,0 +1,90 @@
+import io
+import os
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from astropy.io import fits
+
+DEFAULT_WORKERS = 4  # Reader threads
+DEFAULT_PREFETCH = 16  # Files read ahead of the one being processed
+DEFAULT_MAX_BYTES = 256 * 2**20  # Memory budget of the files held at once
+
+FitsData = namedtuple('FitsData', ['header', 'data'])
+
+
+def read_fits(fits_file):
+    """Read a whole FITS file in one sequential read and parse its spectrum extension.
+
+    Returns the header and a copy of the table of HDU 1. Reading the raw bytes also leaves
+    the file in the page cache for tools that reopen it themselves (e.g. xspec).
+    """
+    with open(fits_file, 'rb') as f:
+        raw = f.read()
+    with fits.open(io.BytesIO(raw)) as hdul:
+        return FitsData(hdul[1].header.copy(), hdul[1].data.copy())
+
+
+class FitsPrefetcher:
+    """Read FITS files on a thread pool ahead of the loop that processes them.
+
+    Files are read in the order of ``fits_files``. Accessing ``reader[i]`` waits for file i
+    (reading it now if needed) and schedules the following ``prefetch`` files, as long as
+    the files held stay within ``max_bytes``; at least one file is always read ahead.
+    ``discard_before(i)`` frees the files the loop has moved past. Iterating yields
+    (file, FitsData) pairs in order and discards each file after it is processed.
+    """
+
+    def __init__(self, fits_files, workers=DEFAULT_WORKERS, prefetch=DEFAULT_PREFETCH, max_bytes=DEFAULT_MAX_BYTES):
+        self.fits_files = list(fits_files)
+        self.prefetch = prefetch
+        self.max_bytes = max_bytes
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._pending = {}  # File index -> future
+        self._sizes = {}  # File index -> bytes on disk, a proxy for the memory it takes
+        self._held_bytes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        for future in self._pending.values():
+            future.cancel()
+        self._executor.shutdown(wait=True)
+        self._pending.clear()
+        self._held_bytes = 0
+
+    def __len__(self):
+        return len(self.fits_files)
+
+    def _submit(self, i):
+        self._sizes[i] = os.path.getsize(self.fits_files[i])
+        self._held_bytes += self._sizes[i]
+        self._pending[i] = self._executor.submit(read_fits, self.fits_files[i])
+
+    def _schedule(self, i):
+        if i not in self._pending:
+            self._submit(i)
+        for k in range(i + 1, min(i + 1 + self.prefetch, len(self.fits_files))):
+            if k in self._pending:
+                continue
+            if k > i + 1 and self._held_bytes + os.path.getsize(self.fits_files[k]) > self.max_bytes:
+                break
+            self._submit(k)
+
+    def __getitem__(self, i):
+        self._schedule(i)
+        return self._pending[i].result()
+
+    def discard_before(self, i):
+        """Free the files before index i."""
+        for k in [k for k in self._pending if k < i]:
+            self._pending.pop(k).cancel()
+            self._held_bytes -= self._sizes.pop(k)
+
+    def __iter__(self):
+        for i, fits_file in enumerate(self.fits_files):
+            self.discard_before(i)
+            yield fits_file, self[i]
+        self.discard_before(len(self.fits_files))
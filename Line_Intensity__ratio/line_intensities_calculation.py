@@ -1,11 +1,13 @@
 import os
 import argparse
+import tempfile
 import numpy as np
 import pandas as pd
-from astropy.io import fits
 from scipy.signal import find_peaks
 from scipy.integrate import quad
 from xspec import Spectrum
+from spectral_cube import SpectralCube
+from fits_prefetch import FitsPrefetcher, DEFAULT_PREFETCH
 import csv
 
 # Default constants
@@ -27,8 +29,70 @@ def initialize_csv(csv_file, geo_headers, ratio_headers):
             writer = csv.DictWriter(f, fieldnames=geo_headers + ratio_headers)
             writer.writeheader()
 
-def process_fits_folder(folder_path, bg_folder_path, response_path, file_path, csv_file):
-    """Process FITS files in the given folder and calculate line intensity ratios."""
+def spectrum_ratios(class_l1_data, bkg_file, element_data):
+    """Calculate the line intensity ratios relative to Si of one spectrum file."""
+    
+    # Loading spectrum data
+    spec_data = Spectrum(class_l1_data, bkg_file, 'class_rmf_v1.rmf', 'class_arf_v1_ohm.arf')
+    spec_data.ignore(IGNORE_STRING)
+    
+    # Extracting energy and count data
+    energy_edges = np.array(spec_data.energies)
+    counts = np.array(spec_data.values)
+    energy_centers = np.mean(energy_edges, axis=1)
+    
+    # Detecting peaks in the spectrum
+    peak_indices, _ = find_peaks(counts)
+    peak_energies = energy_centers[peak_indices]
+    
+    # Calculating flux for each element
+    element_flux = {}
+    for _, row in element_data.iterrows():
+        element = row['element_name']
+        kalpha = row['kalpha']
+        
+        # Finding the closest detected peak to the element's K_alpha energy
+        closest_peak_idx = np.argmin(np.abs(peak_energies - kalpha))
+        peak_center = peak_energies[closest_peak_idx]
+        
+        # If the closest peak is beyond the threshold (5 keV) ignore the element
+        if abs(peak_center - kalpha) <= 0.5:
+            def count_func(e):
+                return np.interp(e, energy_centers, counts)
+            
+            window = 0.1  # Energy window for integration
+            flux, _ = quad(count_func, peak_center - window, peak_center + window)
+            element_flux[element] = flux
+        else:
+            element_flux[element] = 0
+    
+    # Calculating ratios relative to Si
+    si_flux = element_flux.get('si', 0)
+    return {f'{element}/si': (flux / si_flux if si_flux > 0 else 0) for element, flux in element_flux.items()}
+
+def geo_row(headers):
+    """Footprint corners from a FITS header or a cube metadata row."""
+    return {
+        'V0_lat': headers['V0_LAT'],
+        'V0_long': headers['V0_LON'],
+        'V1_lat': headers['V1_LAT'],
+        'V1_long': headers['V1_LON'],
+        'V2_lat': headers['V2_LAT'],
+        'V2_long': headers['V2_LON'],
+        'V3_lat': headers['V3_LAT'],
+        'V3_long': headers['V3_LON']
+    }
+
+def process_fits_folder(folder_path, bg_folder_path, response_path, file_path, csv_file, prefetch=DEFAULT_PREFETCH):
+    """Process FITS files in the given folder and calculate line intensity ratios.
+    
+    Like in process_cube, the paths are relative to the directory the script is run from.
+    """
+    
+    # Paths are resolved before moving to the response folder
+    folder_path, csv_file = os.path.abspath(folder_path), os.path.abspath(csv_file)
+    bkg_file = os.path.abspath(os.path.join(bg_folder_path, 'background_allevents.fits'))
+    file_path = os.path.abspath(file_path)
     
     # Response Path
     os.chdir(response_path)
@@ -42,73 +106,67 @@ def process_fits_folder(folder_path, bg_folder_path, response_path, file_path, c
 
     initialize_csv(csv_file, geo_headers, ratio_headers)
     
-    for file_name in os.listdir(folder_path):
-        if not file_name.endswith('.fits'):
-            continue  # Skip non-FITS files
-        
-        class_l1_data = os.path.join(folder_path, file_name)
-        bkg_file = os.path.join(bg_folder_path, 'background_allevents.fits')
-        
-        # Loading spectrum data
-        spec_data = Spectrum(class_l1_data, bkg_file, 'class_rmf_v1.rmf', 'class_arf_v1_ohm.arf')
-        spec_data.ignore(IGNORE_STRING)
-        
-        # Extracting energy and count data
-        energy_edges = np.array(spec_data.energies)
-        counts = np.array(spec_data.values)
-        energy_centers = np.mean(energy_edges, axis=1)
-        
-        # Detecting peaks in the spectrum
-        peak_indices, _ = find_peaks(counts)
-        peak_energies = energy_centers[peak_indices]
-        
-        # Calculating flux for each element
-        element_flux = {}
-        for _, row in element_data.iterrows():
-            element = row['element_name']
-            kalpha = row['kalpha']
+    fits_files = sorted(os.path.join(folder_path, f) for f in os.listdir(folder_path) if f.endswith('.fits'))  # Skip non-FITS files
+    
+    # The next files are read on background threads, so xspec finds them in the page cache
+    with FitsPrefetcher(fits_files, prefetch=prefetch) as reader:
+        for class_l1_data, prefetched in reader:
+            ratios = spectrum_ratios(class_l1_data, bkg_file, element_data)
             
-            # Finding the closest detected peak to the element's K_alpha energy
-            closest_peak_idx = np.argmin(np.abs(peak_energies - kalpha))
-            peak_center = peak_energies[closest_peak_idx]
+            # Extracting geographic data from the prefetched FITS file header
+            geo_data = geo_row(prefetched.header)
             
-            # If the closest peak is beyond the threshold (5 keV) ignore the element
-            if abs(peak_center - kalpha) <= 0.5:
-                def count_func(e):
-                    return np.interp(e, energy_centers, counts)
-                
-                window = 0.1  # Energy window for integration
-                flux, _ = quad(count_func, peak_center - window, peak_center + window)
-                element_flux[element] = flux
-            else:
-                element_flux[element] = 0
-        
-        # Calculating ratios relative to Si
-        si_flux = element_flux.get('si', 0)
-        ratios = {f'{element}/si': (flux / si_flux if si_flux > 0 else 0) for element, flux in element_flux.items()}
-        
-        # Extracting geographic data from the FITS file header
-        hdul = fits.open(class_l1_data)
-        headers = hdul[1].header
-        geo_data = {
-            'V0_lat': headers['V0_LAT'],
-            'V0_long': headers['V0_LON'],
-            'V1_lat': headers['V1_LAT'],
-            'V1_long': headers['V1_LON'],
-            'V2_lat': headers['V2_LAT'],
-            'V2_long': headers['V2_LON'],
-            'V3_lat': headers['V3_LAT'],
-            'V3_long': headers['V3_LON']
-        }
-        hdul.close()
-        
-        # Combining geographic data and intensity ratios into a single row
-        data_row = {**geo_data, **ratios}
-        
-        # Appending the row to the CSV file
+            # Combining geographic data and intensity ratios into a single row
+            data_row = {**geo_data, **ratios}
+            
+            # Appending the row to the CSV file
+            with open(csv_file, 'a', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=geo_headers + ratio_headers)
+                writer.writerow(data_row)
+
+def process_cube(cube_dir, ranges_file, bg_folder_path, response_path, file_path, csv_file):
+    """Calculate line intensity ratios of the spectra or co-added ranges of a cube written by spectral_cube.py.
+    
+    The ranges are read from the compiled_ranges.csv written by compile_fits.py --cube; without
+    it every day-time spectrum is used. Each range is written to a temporary FITS file for xspec,
+    next to the output CSV, and the footprint corners are taken from the cube metadata instead
+    of reopening the file.
+    Like in process_fits_folder, the paths are relative to the directory the script is run from.
+    """
+    
+    # Paths are resolved before moving to the response folder
+    cube_dir, csv_file = os.path.abspath(cube_dir), os.path.abspath(csv_file)
+    bkg_file = os.path.abspath(os.path.join(bg_folder_path, 'background_allevents.fits'))
+    file_path = os.path.abspath(file_path)
+    cube = SpectralCube(cube_dir)
+    if ranges_file:
+        ranges = pd.read_csv(ranges_file)[['start', 'stop']].to_numpy()
+    else:
+        day = np.flatnonzero(cube.meta['SOLARANG'].to_numpy(dtype=float) <= 90.0)
+        ranges = np.column_stack([day, day + 1])
+    
+    os.chdir(response_path)
+    element_data = load_element_data(file_path)
+    
+    elements = ['o', 'na', 'mg', 'al', 'si', 'p', 's', 'cl', 'ar', 'k', 'ca', 'sc', 'ti', 'v', 'cr', 'mn', 'fe', 'co', 'ni', 'cu', 'zn']
+    ratio_headers = [f"{el}/si" for el in elements]
+    geo_headers = ['V0_lat', 'V0_long', 'V1_lat', 'V1_long', 'V2_lat', 'V2_long', 'V3_lat', 'V3_long']
+
+    initialize_csv(csv_file, geo_headers, ratio_headers)
+    
+    # A scratch file of its own next to the output, so that runs sharing a cube do not overwrite each other's
+    fd, scratch_file = tempfile.mkstemp(prefix='scratch_spectrum_', suffix='.fits', dir=os.path.dirname(csv_file))
+    os.close(fd)
+    try:
         with open(csv_file, 'a', newline='') as f:
             writer = csv.DictWriter(f, fieldnames=geo_headers + ratio_headers)
-            writer.writerow(data_row)
+            for start, stop in ranges:
+                cube.write_pha(start, stop, scratch_file)
+                ratios = spectrum_ratios(scratch_file, bkg_file, element_data)
+                geo_data = geo_row(cube.meta.iloc[(start + stop - 1) // 2])
+                writer.writerow({**geo_data, **ratios})
+    finally:
+        os.remove(scratch_file)
 
 def main():
     parser = argparse.ArgumentParser(description="Process FITS files for line intensity ratios.")
@@ -117,10 +175,16 @@ def main():
     parser.add_argument('--response_path', type=str, default=DEFAULT_RESPONSE_PATH, help="Path to the calibration files.")
     parser.add_argument('--file_path', type=str, default=DEFAULT_FILE_PATH, help="Path to the excitation energy file.")
     parser.add_argument('--csv_file', type=str, default=DEFAULT_CSV_FILE, help="Path to the output CSV file.")
+    parser.add_argument('--cube', type=str, default=None, help="Cube directory written by spectral_cube.py, read instead of --fits_folder.")
+    parser.add_argument('--ranges', type=str, default=None, help="compiled_ranges.csv written by compile_fits.py --cube (default: every day-time spectrum).")
+    parser.add_argument('--prefetch', type=int, default=DEFAULT_PREFETCH, help="Number of FITS files read ahead on background threads.")
     
     args = parser.parse_args()
     
-    process_fits_folder(args.fits_folder, args.bg_folder, args.response_path, args.file_path, args.csv_file)
+    if args.cube:
+        process_cube(args.cube, args.ranges, args.bg_folder, args.response_path, args.file_path, args.csv_file)
+    else:
+        process_fits_folder(args.fits_folder, args.bg_folder, args.response_path, args.file_path, args.csv_file, args.prefetch)
     print("Processing complete. Data appended to CSV.")
 
 if __name__ == "__main__":
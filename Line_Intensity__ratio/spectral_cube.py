@@ -0,0 +1,141 @@
+import os
+import argparse
+import numpy as np
+import pandas as pd
+from astropy.io import fits
+from numpy.lib.format import open_memmap
+
+N_CHANNELS = 2048  # CLASS spectrum channels
+KEV_PER_CHANNEL = 13.5 / 1000
+HEADER_KEYS = ['SOLARANG', 'EXPOSURE', 'V0_LAT', 'V0_LON', 'V1_LAT', 'V1_LON', 'V2_LAT', 'V2_LON', 'V3_LAT', 'V3_LON']
+
+
+def spectrum_times(fits_file):
+    """Start and end time (YYYYMMDDThhmmssmse) from a CLASS L1 file name."""
+    parts = os.path.splitext(os.path.basename(fits_file))[0].split("_")
+    return parts[-2], parts[-1]
+
+
+def ingest(fits_files, cube_dir):
+    """Pack the spectra of a day, orbit or release into one cube directory.
+
+    The cube holds ``counts.npy`` (spectra x channels, float32) and ``prefix.npy``
+    (cumulative counts, one extra leading row of zeros) as memory-mappable arrays,
+    ``meta.csv`` with the file name, start/end time and header keys of each spectrum in
+    time order, and ``template.fits``, the first file, used to write co-added spectra.
+    """
+    fits_files = sorted(fits_files, key=spectrum_times)
+    if not fits_files:
+        raise ValueError("No FITS files to ingest")
+    os.makedirs(cube_dir, exist_ok=True)
+
+    counts = open_memmap(os.path.join(cube_dir, 'counts.npy'), mode='w+', dtype=np.float32, shape=(len(fits_files), N_CHANNELS))
+    prefix = open_memmap(os.path.join(cube_dir, 'prefix.npy'), mode='w+', dtype=np.float64, shape=(len(fits_files) + 1, N_CHANNELS))
+    prefix[0] = 0
+
+    rows = []
+    for i, fits_file in enumerate(fits_files):
+        with fits.open(fits_file) as hdul:
+            header = hdul[1].header
+            counts[i] = hdul[1].data["counts"]
+            rows.append({key: header.get(key, np.nan) for key in HEADER_KEYS})
+        prefix[i + 1] = prefix[i] + counts[i]
+        rows[-1]['file'] = os.path.basename(fits_file)
+        rows[-1]['start_time'], rows[-1]['end_time'] = spectrum_times(fits_file)
+
+    counts.flush()
+    prefix.flush()
+    meta = pd.DataFrame(rows, columns=['file', 'start_time', 'end_time'] + HEADER_KEYS)
+    meta.to_csv(os.path.join(cube_dir, 'meta.csv'), index=False)
+    with fits.open(fits_files[0]) as hdul:
+        hdul.writeto(os.path.join(cube_dir, 'template.fits'), overwrite=True)
+    return len(meta)
+
+
+class SpectralCube:
+    """Read-only view of a cube written by ``ingest``; spectra are addressed by their time-ordered index."""
+
+    def __init__(self, cube_dir):
+        self.cube_dir = cube_dir
+        self.counts = np.load(os.path.join(cube_dir, 'counts.npy'), mmap_mode='r')
+        self.prefix = np.load(os.path.join(cube_dir, 'prefix.npy'), mmap_mode='r')
+        self.meta = pd.read_csv(os.path.join(cube_dir, 'meta.csv'), dtype={'start_time': str, 'end_time': str})
+        with fits.open(os.path.join(cube_dir, 'template.fits')) as hdul:
+            self.channel = hdul[1].data["channel"] * KEV_PER_CHANNEL  # Convert to keV, as in compile_fits
+
+    def __len__(self):
+        return len(self.meta)
+
+    def is_background(self, i):
+        """Night-time (background) spectrum, as in isBG."""
+        return self.meta['SOLARANG'].iat[i] > 90.0
+
+    def coadd(self, start, stop):
+        """Summed counts of spectra start..stop-1, from two rows of the prefix sums."""
+        return np.asarray(self.prefix[stop] - self.prefix[start])
+
+    def time_slice(self, start_time, end_time):
+        """Index range of the spectra lying entirely within [start_time, end_time]."""
+        start = int(np.searchsorted(self.meta['start_time'].to_numpy(dtype=str), start_time, side='left'))
+        stop = int(np.searchsorted(self.meta['end_time'].to_numpy(dtype=str), end_time, side='right'))
+        return start, max(start, stop)
+
+    def coadd_time(self, start_time, end_time):
+        """Summed counts of all spectra within a time range."""
+        return self.coadd(*self.time_slice(start_time, end_time))
+
+    def write_pha(self, start, stop, output_file):
+        """Write spectra start..stop-1 co-added as a CLASS L1 FITS file, for tools that need a file (xspec).
+
+        The exposure is the total of the co-added spectra; the other header keys, including
+        the footprint corners, are those of the middle spectrum of the range.
+        """
+        middle = self.meta.iloc[(start + stop - 1) // 2]
+        with fits.open(os.path.join(self.cube_dir, 'template.fits')) as hdul:
+            hdul[1].data["counts"] = self.coadd(start, stop).astype(hdul[1].data["counts"].dtype)
+            for key in HEADER_KEYS:
+                if key in hdul[1].header and pd.notna(middle[key]):
+                    hdul[1].header[key] = middle[key]
+            if 'EXPOSURE' in hdul[1].header:
+                hdul[1].header['EXPOSURE'] = float(self.meta['EXPOSURE'].iloc[start:stop].sum())
+            hdul.writeto(output_file, overwrite=True)
+        return output_file
+
+    def range_name(self, start, stop):
+        """File name of a co-added range, in the naming of the CLASS time adder."""
+        return 'ch2_cla_L1_time_added_' + self.meta['start_time'].iat[start] + '-' + self.meta['end_time'].iat[stop - 1] + '.fits'
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack CLASS L1 spectra into a memory-mapped cube and co-add time ranges.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    pack = subparsers.add_parser('ingest', help="Pack all FITS files of a folder (a day, orbit or release) into a cube.")
+    pack.add_argument('fits_directory', type=str, help="Folder containing the FITS files.")
+    pack.add_argument('cube_dir', type=str, help="Output cube directory.")
+
+    add = subparsers.add_parser('coadd', help="Write the co-added spectrum of a time range as a FITS file.")
+    add.add_argument('cube_dir', type=str, help="Cube directory.")
+    add.add_argument('start_time', type=str, help="Start time, YYYYMMDDThhmmssmse.")
+    add.add_argument('end_time', type=str, help="End time, YYYYMMDDThhmmssmse.")
+    add.add_argument('--output', type=str, default=None, help="Output FITS file (default: named after the time range).")
+
+    args = parser.parse_args()
+
+    if args.command == 'ingest':
+        fits_files = [os.path.join(args.fits_directory, f) for f in os.listdir(args.fits_directory) if f.endswith(".fits")]
+        n_spectra = ingest(fits_files, args.cube_dir)
+        print(f"{n_spectra} spectra packed into {args.cube_dir}")
+        return
+
+    cube = SpectralCube(args.cube_dir)
+    start, stop = cube.time_slice(args.start_time, args.end_time)
+    if stop == start:
+        raise SystemExit(f"No spectra between {args.start_time} and {args.end_time}")
+    output_file = args.output or cube.range_name(start, stop)
+    cube.write_pha(start, stop, output_file)
+    print(f"{stop - start} spectra co-added into {output_file}")
+
+
+if __name__ == "__main__":
+    main()
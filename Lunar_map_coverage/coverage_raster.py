@@ -0,0 +1,165 @@
+import os
+import sys
+import argparse
+import numpy as np
+import pandas as pd
+import rasterio
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Common'))
+from lunar_common import LUNAR_CRS, footprint_rings, footprint_spans, footprint_vertices, grid_shape, grid_transform, read_new_rows
+
+DEFAULT_RESOLUTION = 0.1  # Grid cell size in degrees
+DEFAULT_EXPOSURE = 96.0  # Integration time of one footprint in seconds
+DEFAULT_BATCH_SIZE = 5000  # Footprints rasterized at once, bounds the temporary memory
+DEFAULT_BAND = 10.0  # Latitude band width of the summary in degrees
+
+
+def rasterize_footprints(table, resolution, exposure=DEFAULT_EXPOSURE, exposure_column=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Return the revisit count and total exposure (seconds) per cell for a footprint table."""
+    n_rows, n_cols = grid_shape(resolution)
+    width = n_cols + 1  # One spare column for the end markers of the difference arrays
+    count_diff = np.zeros(n_rows * width, dtype=np.float64)
+    exposure_diff = np.zeros(n_rows * width, dtype=np.float64)
+
+    ring_lat, ring_lon = footprint_rings(*footprint_vertices(table))
+    if exposure_column:
+        exposures = table[exposure_column].to_numpy(dtype=float)
+    else:
+        exposures = np.full(len(table), exposure)
+
+    # Skip rows without coordinates and degenerate footprints (e.g. all vertices at 0, 0)
+    area = 0.5 * np.abs((ring_lon * np.roll(ring_lat, -1, axis=1) - np.roll(ring_lon, -1, axis=1) * ring_lat).sum(axis=1))
+    keep = np.isfinite(area) & (area > 0)
+    ring_lat, ring_lon, exposures = ring_lat[keep], ring_lon[keep], exposures[keep]
+
+    # Each run adds +1 at its first column and -1 after its last; a cumulative sum along the rows gives the counts
+    for start in range(0, len(ring_lat), batch_size):
+        stop = start + batch_size
+        owner, rows, first, last = footprint_spans(ring_lat[start:stop], ring_lon[start:stop], resolution)
+        weights = exposures[start:stop][owner]
+        count_diff += np.bincount(rows * width + first, minlength=count_diff.size)
+        count_diff -= np.bincount(rows * width + last + 1, minlength=count_diff.size)
+        exposure_diff += np.bincount(rows * width + first, weights=weights, minlength=count_diff.size)
+        exposure_diff -= np.bincount(rows * width + last + 1, weights=weights, minlength=count_diff.size)
+
+    count = np.cumsum(count_diff.reshape(n_rows, width), axis=1)[:, :n_cols]
+    total_exposure = np.cumsum(exposure_diff.reshape(n_rows, width), axis=1)[:, :n_cols]
+    return np.rint(count).astype(np.int32), total_exposure
+
+
+def update_coverage(csv_file, state_file, resolution=DEFAULT_RESOLUTION, exposure=DEFAULT_EXPOSURE, exposure_column=None, rebuild=False):
+    """Fold footprints appended to the catalog since the last run into the persisted coverage state."""
+    state = None
+    if not rebuild and os.path.isfile(state_file):
+        state = dict(np.load(state_file, allow_pickle=False))
+        if not np.isclose(state["resolution"], resolution):
+            raise ValueError(f"{state_file} was built at {float(state['resolution'])} deg, not {resolution} deg. Use --rebuild.")
+
+        if "offset" not in state:
+            raise ValueError(f"{state_file} was written by an older version without a byte offset. Use --rebuild.")
+
+    # Only the bytes appended since the last run are parsed; a rewritten or truncated catalog is an error
+    if state is not None:
+        new_rows, offset, digest = read_new_rows(csv_file, int(state["offset"]), str(state["digest"]))
+    else:
+        new_rows, offset, digest = read_new_rows(csv_file, 0)
+    rows_done = int(state["rows_done"]) if state is not None else 0
+
+    count, total_exposure = rasterize_footprints(new_rows, resolution, exposure, exposure_column)
+    if state is not None:
+        count += state["count"]
+        total_exposure += state["exposure"]
+
+    np.savez_compressed(
+        state_file,
+        count=count,
+        exposure=total_exposure,  # float64, so that daily updates do not accumulate rounding error
+        resolution=resolution,
+        rows_done=rows_done + len(new_rows),
+        offset=offset,
+        digest=digest,
+    )
+    print(f"Added {len(new_rows)} footprints ({rows_done + len(new_rows)} in total) to {state_file}")
+    return count, total_exposure
+
+
+def coverage_summary(count, total_exposure, resolution, band=DEFAULT_BAND):
+    """Area-weighted coverage percentage, revisits and exposure per latitude band, plus a global row."""
+    n_rows, n_cols = count.shape
+    lat_centres = 90 - (np.arange(n_rows) + 0.5) * resolution
+    weights = np.cos(np.radians(lat_centres))  # Cell area shrinks towards the poles
+    band_index = np.minimum(np.floor((lat_centres + 90) / band).astype(int), int(np.ceil(180 / band)) - 1)
+
+    covered = count > 0
+    n_bands = band_index.max() + 1
+    covered_area = np.bincount(band_index, weights=covered.sum(axis=1) * weights, minlength=n_bands)
+    total_area = np.bincount(band_index, weights=np.full(n_rows, n_cols) * weights, minlength=n_bands)
+    covered_cells = np.bincount(band_index, weights=covered.sum(axis=1), minlength=n_bands)
+    revisits = np.bincount(band_index, weights=count.sum(axis=1), minlength=n_bands)
+    max_revisits = np.zeros(n_bands, dtype=np.int64)
+    np.maximum.at(max_revisits, band_index, count.max(axis=1))
+    exposure = np.bincount(band_index, weights=total_exposure.sum(axis=1), minlength=n_bands)
+
+    lat_min = -90 + np.arange(n_bands) * band
+    summary = pd.DataFrame({
+        'lat_min': lat_min,
+        'lat_max': np.minimum(lat_min + band, 90),
+        'coverage_percent': 100 * covered_area / total_area,
+        'mean_revisits': np.divide(revisits, covered_cells, out=np.zeros(n_bands), where=covered_cells > 0),
+        'max_revisits': max_revisits,
+        'exposure_s': exposure,
+    })
+    summary.loc[len(summary)] = {
+        'lat_min': -90,
+        'lat_max': 90,
+        'coverage_percent': 100 * covered_area.sum() / total_area.sum(),
+        'mean_revisits': revisits.sum() / max(covered_cells.sum(), 1),
+        'max_revisits': count.max(),
+        'exposure_s': exposure.sum(),
+    }
+    return summary
+
+
+def write_geotiff(count, total_exposure, resolution, output_file):
+    """Write covered flag, revisit count and exposure as a 3-band GeoTIFF in the lunar equirectangular CRS."""
+    transform = grid_transform(resolution)
+    with rasterio.open(
+        output_file, 'w', driver='GTiff', height=count.shape[0], width=count.shape[1], count=3,
+        dtype='float32', crs=LUNAR_CRS.to_wkt(), transform=transform, compress='deflate', tiled=True,
+    ) as dst:
+        dst.write((count > 0).astype(np.float32), 1)
+        dst.write(count.astype(np.float32), 2)
+        dst.write(total_exposure.astype(np.float32), 3)
+        dst.set_band_description(1, 'covered')
+        dst.set_band_description(2, 'revisit_count')
+        dst.set_band_description(3, 'exposure_s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rasterize CLASS footprints into global coverage and revisit-count grids.")
+    parser.add_argument('csv_file', type=str, help="Footprint CSV, e.g. coordinates.csv.")
+    parser.add_argument('--state', type=str, default='./coverage_state.npz', help="NPZ holding the accumulated grids; new catalog rows are added to it.")
+    parser.add_argument('--resolution', type=float, default=DEFAULT_RESOLUTION, help="Grid cell size in degrees.")
+    parser.add_argument('--exposure', type=float, default=DEFAULT_EXPOSURE, help="Exposure of each footprint in seconds.")
+    parser.add_argument('--exposure_column', type=str, default=None, help="CSV column holding per-footprint exposure (overrides --exposure).")
+    parser.add_argument('--band', type=float, default=DEFAULT_BAND, help="Latitude band width of the summary in degrees.")
+    parser.add_argument('--summary', type=str, default=None, help="Write the latitude band summary to this CSV.")
+    parser.add_argument('--geotiff', type=str, default=None, help="Also write the grids as a GeoTIFF.")
+    parser.add_argument('--rebuild', action='store_true', help="Ignore the existing state and rasterize the whole catalog again.")
+
+    args = parser.parse_args()
+
+    count, total_exposure = update_coverage(args.csv_file, args.state, args.resolution, args.exposure, args.exposure_column, args.rebuild)
+
+    summary = coverage_summary(count, total_exposure, args.resolution, args.band)
+    print(summary.to_string(index=False, float_format="%.2f"))
+    if args.summary:
+        summary.to_csv(args.summary, index=False)
+        print(f"Summary saved to {args.summary}")
+    if args.geotiff:
+        write_geotiff(count, total_exposure, args.resolution, args.geotiff)
+        print(f"GeoTIFF saved to {args.geotiff}")
+
+
+if __name__ == "__main__":
+    main()
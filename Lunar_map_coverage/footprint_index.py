@@ -0,0 +1,118 @@
+import os
+import sys
+import argparse
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import shapely
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Common'))
+from lunar_common import footprint_vertices, read_catalog
+
+CACHE_SUFFIX = "_footprints.parquet"  # Parsed catalog table; the STRtree itself is rebuilt on load
+
+
+def footprint_polygons(table):
+    """Build one lon/lat polygon per footprint row."""
+    latitudes, longitudes = footprint_vertices(table)
+    return shapely.polygons(np.stack([longitudes, latitudes], axis=-1))
+
+
+def cache_path(csv_file):
+    """Path of the parsed-table cache stored next to the catalog CSV."""
+    return os.path.splitext(csv_file)[0] + CACHE_SUFFIX
+
+
+class FootprintIndex:
+    """STRtree over footprint quadrilaterals answering box, point and polygon queries."""
+
+    def __init__(self, table):
+        self.table = table.reset_index(drop=True)
+        self.polygons = footprint_polygons(self.table)
+        self.tree = shapely.STRtree(self.polygons)
+
+    @classmethod
+    def build(cls, csv_file):
+        """Read the catalog CSV, index it and cache the parsed table next to it."""
+        index = cls(read_catalog(csv_file))
+        index.save(csv_file)
+        return index
+
+    @classmethod
+    def load(cls, csv_file, rebuild=False):
+        """Index the cached table, or the CSV itself if the cache is missing or older than the CSV.
+
+        Only the parsing of the CSV is cached; the STRtree is built again from the vertex
+        columns, which takes a fraction of the time of reading the CSV.
+        """
+        path = cache_path(csv_file)
+        stat = os.stat(csv_file)
+        if not rebuild and os.path.isfile(path):
+            stamp = pq.read_schema(path).metadata or {}
+            if stamp.get(b'source_size') == str(stat.st_size).encode() and stamp.get(b'source_mtime') == str(stat.st_mtime_ns).encode():
+                return cls(pq.read_table(path).to_pandas())
+        return cls.build(csv_file)
+
+    def save(self, csv_file):
+        """Write the whole catalog table (all columns and dtypes) as Parquet, stamped with the CSV size and mtime."""
+        stat = os.stat(csv_file)
+        table = pa.Table.from_pandas(self.table, preserve_index=False)
+        stamp = {b'source_size': str(stat.st_size).encode(), b'source_mtime': str(stat.st_mtime_ns).encode()}
+        pq.write_table(table.replace_schema_metadata({**(table.schema.metadata or {}), **stamp}), cache_path(csv_file))
+
+    def query(self, geometry):
+        """Return the catalog rows whose footprint intersects a lon/lat geometry."""
+        # Also test the geometry shifted by 360 degrees to catch footprints unwrapped past +180
+        shifted = shapely.transform(geometry, lambda coords: coords + [360.0, 0.0])
+        hits = np.concatenate([
+            self.tree.query(geometry, predicate="intersects"),
+            self.tree.query(shifted, predicate="intersects"),
+        ])
+        return self.table.iloc[np.unique(hits)]
+
+    def query_box(self, lat_min, lat_max, lon_min, lon_max):
+        """Footprints overlapping a latitude/longitude box."""
+        return self.query(shapely.box(lon_min, lat_min, lon_max, lat_max))
+
+    def query_point(self, lat, lon):
+        """Footprints covering a single location, e.g. a crater centre."""
+        return self.query(shapely.points(lon, lat))
+
+    def query_polygon(self, polygon):
+        """Footprints overlapping a lon/lat polygon given as a shapely geometry or WKT string."""
+        if isinstance(polygon, str):
+            polygon = shapely.from_wkt(polygon)
+        return self.query(polygon)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the footprint catalog by box, point or polygon.")
+    parser.add_argument('csv_file', type=str, help="Footprint CSV (coordinates.csv or a line intensity ratio CSV).")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--box', type=float, nargs=4, metavar=('LAT_MIN', 'LAT_MAX', 'LON_MIN', 'LON_MAX'), help="Latitude/longitude box in degrees.")
+    group.add_argument('--point', type=float, nargs=2, metavar=('LAT', 'LON'), help="Point in degrees.")
+    group.add_argument('--polygon', type=str, help="WKT polygon with lon/lat coordinates in degrees.")
+    parser.add_argument('--output', type=str, default=None, help="Write the matching rows to this CSV instead of printing them.")
+    parser.add_argument('--rebuild', action='store_true', help="Parse the CSV again even if the cached table is up to date.")
+
+    args = parser.parse_args()
+
+    index = FootprintIndex.load(args.csv_file, rebuild=args.rebuild)
+    if args.box:
+        matches = index.query_box(*args.box)
+    elif args.point:
+        matches = index.query_point(*args.point)
+    else:
+        matches = index.query_polygon(args.polygon)
+
+    if args.output:
+        matches.to_csv(args.output, index=False)
+        print(f"{len(matches)} matching footprints saved to {args.output}")
+    else:
+        print(matches.to_string(index=False))
+        print(f"{len(matches)} matching footprints")
+
+
+if __name__ == "__main__":
+    main()
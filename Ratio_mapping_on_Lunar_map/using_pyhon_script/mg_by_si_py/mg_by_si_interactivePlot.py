@@ -8,7 +8,7 @@ import plotly.graph_objects as go
 from PIL import Image
 from io import BytesIO
 import base64
-from shapely.geometry import Polygon
+import shapely
 
 # Set the environment variable to ignore celestial body mismatches
 os.environ["PROJ_IGNORE_CELESTIAL_BODY"] = "YES"
@@ -45,26 +45,27 @@ try:
 except UnicodeDecodeError:
     df = pd.read_csv(csv_file, encoding="latin1")
 
-# Transform coordinates
+# Transform coordinates of all footprints in a single call
 transformer = Transformer.from_crs(csv_crs, geotiff_crs, always_xy=True)
-polygons, mg_si_values = [], []
-
-for _, row in df.iterrows():
-    try:
-        longitudes = [float(row[f"V{i}_LONGITUDE"]) for i in range(4)]
-        latitudes = [float(row[f"V{i}_LATITUDE"]) for i in range(4)]
-        longitudes.append(longitudes[0])
-        latitudes.append(latitudes[0])
-        x_coords, y_coords = transformer.transform(longitudes, latitudes)
-        x_coords_deg = [max(min(x / 1737400 * 180 / np.pi, 180), -180) for x in x_coords]
-        y_coords_deg = [max(min(y / 1737400 * 180 / np.pi, 90), -90) for y in y_coords]
-        # Simplify polygons using Shapely
-        poly = Polygon(zip(x_coords_deg, y_coords_deg)).simplify(0.01)  # Simplify by 0.01 degrees
-        if poly.is_valid:
-            polygons.append((list(poly.exterior.coords.xy[0]), list(poly.exterior.coords.xy[1])))
-            mg_si_values.append(float(row["mg/si"]))
-    except KeyError as e:
-        print(f"Error in row: {row}, {e}")
+longitudes = df[[f"V{i}_LONGITUDE" for i in range(4)]].to_numpy(dtype=float)
+latitudes = df[[f"V{i}_LATITUDE" for i in range(4)]].to_numpy(dtype=float)
+x_coords, y_coords = transformer.transform(longitudes, latitudes)
+x_coords_deg = np.clip(x_coords / 1737400 * 180 / np.pi, -180, 180)
+y_coords_deg = np.clip(y_coords / 1737400 * 180 / np.pi, -90, 90)
+
+# Build and simplify all polygons at once using Shapely
+footprints = shapely.simplify(shapely.polygons(np.stack([x_coords_deg, y_coords_deg], axis=-1)), 0.01)  # Simplify by 0.01 degrees
+valid = shapely.is_valid(footprints) & ~shapely.is_empty(footprints)
+rings = shapely.get_exterior_ring(footprints[valid])
+ring_sizes = shapely.get_num_coordinates(rings)
+ring_coords = shapely.get_coordinates(rings)
+ring_starts = np.concatenate([[0], np.cumsum(ring_sizes)[:-1]])
+
+# Average vertex position (closing vertex excluded) for the hover text
+centroids = (np.add.reduceat(ring_coords, ring_starts, axis=0) - ring_coords[ring_starts + ring_sizes - 1]) / (ring_sizes - 1)[:, None]
+
+polygons = [(ring[:, 0].tolist(), ring[:, 1].tolist()) for ring in np.split(ring_coords, ring_starts[1:])]
+mg_si_values = df["mg/si"].to_numpy(dtype=float)[valid].tolist()
 
 # Normalize mg/si
 mg_si_min, mg_si_max = min(mg_si_values), max(mg_si_values)
@@ -98,9 +99,7 @@ fig.add_layout_image(
 )
 
 # Add simplified polygons with hover information
-for (x_coords_deg, y_coords_deg), color, mg_si in zip(polygons, color_map, mg_si_values):
-    a = sum(x_coords_deg[:-1]) / len(x_coords_deg[:-1])  # Average longitude
-    b = sum(y_coords_deg[:-1]) / len(y_coords_deg[:-1])  # Average latitude
+for (x_coords_deg, y_coords_deg), (a, b), color, mg_si in zip(polygons, centroids, color_map, mg_si_values):
     fig.add_trace(
         go.Scatter(
             x=x_coords_deg,
@@ -3,14 +3,22 @@ import pandas as pd
 # File paths
 input_csv = r"D:\subpixelmap\subpixel_resolutions.csv"  # Path to your input CSV
 output_csv = r"D:\subpixelmap\filtered_subpixel_resolutions.csv"  # Path for the filtered CSV
+catalog_root = None  # Set to a catalog directory (ratio_catalog.py) to filter through it instead of writing a filtered copy
 
-# Read the input CSV file
-data = pd.read_csv(input_csv)
+if catalog_root:
+    # The grid is ingested beforehand (python ratio_catalog.py ingest subpixel_resolutions.csv CATALOG --kind grid);
+    # the non-zero filter is applied while reading the Parquet files
+    from ratio_catalog import query
+    n_rows = len(query(catalog_root, 'grid', columns=['latitude'], nonzero=['mg/si_avg']))
+    print(f"{n_rows} cells with non-zero mg/si_avg available from the catalog: {catalog_root}")
+else:
+    # Read the input CSV file
+    data = pd.read_csv(input_csv)
 
-# Filter rows where 'mg/si_avg' is not zero
-filtered_data = data[data['mg/si_avg'] != 0]
+    # Filter rows where 'mg/si_avg' is not zero
+    filtered_data = data[data['mg/si_avg'] != 0]
 
-# Save the filtered data to a new CSV file
-filtered_data.to_csv(output_csv, index=False)
+    # Save the filtered data to a new CSV file
+    filtered_data.to_csv(output_csv, index=False)
 
-print(f"Filtered data saved successfully to: {output_csv}")
+    print(f"Filtered data saved successfully to: {output_csv}")
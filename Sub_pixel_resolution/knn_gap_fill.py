@@ -0,0 +1,206 @@
+import os
+import sys
+import argparse
+import multiprocessing
+import numpy as np
+import pandas as pd
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from scipy.spatial import cKDTree
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Common'))
+from lunar_common import LUNAR_RADIUS, cell_rows_cols, check_unique_cells, grid_layout, infer_grid_origin
+
+LUNAR_RADIUS_KM = LUNAR_RADIUS / 1000
+DEFAULT_RESOLUTION = 0.1  # Grid cell size in degrees
+DEFAULT_NEIGHBOURS = 8
+DEFAULT_POWER = 2.0  # Inverse distance weighting exponent
+DEFAULT_MAX_DISTANCE_KM = 100.0  # Cells farther than this from every observation stay empty
+DEFAULT_BAND = 10.0  # Latitude band handled by one task, in degrees
+
+# Set by init_worker, in the parent before the workers fork or once per spawned worker
+_tree = None
+_known_values = None
+_known_cells = None
+
+
+def ratio_columns(columns):
+    """Split the ratio columns of a grid CSV into the means and their count and uncertainty columns."""
+    lower = {col: col.lower() for col in columns}
+    companions = [col for col in columns if lower[col] == 'count' or ('/si' in col and lower[col].endswith(('_std', '_err', '_count')))]
+    means = [col for col in columns if '/si' in col and col not in companions]
+    return means, companions
+
+
+def unit_vectors(latitudes, longitudes):
+    """Cartesian unit vectors of points on the sphere, so that chord distance follows great-circle distance."""
+    lat, lon = np.radians(latitudes), np.radians(longitudes)
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+def chord_to_km(chord):
+    """Great-circle distance on the Moon for a chord length on the unit sphere."""
+    return 2 * np.arcsin(np.clip(chord / 2, 0, 1)) * LUNAR_RADIUS_KM
+
+
+def km_to_chord(distance_km):
+    """Chord length on the unit sphere for a great-circle distance on the Moon."""
+    return 2 * np.sin(min(distance_km / LUNAR_RADIUS_KM, np.pi) / 2)
+
+
+def cell_index(latitudes, longitudes, resolution, origin=None):
+    """Flat index of the grid cell whose centre is nearest to each point, as placed by ratio_geotiff."""
+    rows, cols = cell_rows_cols(latitudes, longitudes, resolution, origin)
+    return rows * int(round(360 / resolution)) + cols
+
+
+def snap_to_grid(latitudes, longitudes, resolution, origin=None):
+    """Centre of the grid cell nearest to each point, on the lattice of the filled cells."""
+    _, _, north, west = grid_layout(resolution, origin)
+    rows, cols = cell_rows_cols(latitudes, longitudes, resolution, origin)
+    return north - rows * resolution, west + cols * resolution
+
+
+def grid_centres(resolution, origin=None):
+    """Latitudes (north to south) and longitudes (west to east) of the cell centres of the global grid."""
+    n_rows, n_cols, north, west = grid_layout(resolution, origin)
+    return north - np.arange(n_rows) * resolution, west + np.arange(n_cols) * resolution
+
+
+def init_worker(known_latitudes, known_longitudes, known_values, known_cells):
+    """Build the KD-tree of observed cells and keep it with the observed values for fill_band."""
+    global _tree, _known_values, _known_cells
+    _tree = cKDTree(unit_vectors(known_latitudes, known_longitudes))
+    _known_values = known_values
+    _known_cells = known_cells
+
+
+def fill_band(task):
+    """Estimate every empty cell of one latitude band from its nearest observed cells."""
+    lat, lon, resolution, origin, neighbours, power, max_distance_km = task
+    lat, lon = np.repeat(lat, len(lon)), np.tile(lon, len(lat))
+
+    # Keep only cells without an observation
+    cells = cell_index(lat, lon, resolution, origin)
+    position = np.minimum(np.searchsorted(_known_cells, cells), len(_known_cells) - 1)
+    empty = _known_cells[position] != cells
+    lat, lon = lat[empty], lon[empty]
+
+    distance, index = _tree.query(unit_vectors(lat, lon), k=neighbours, distance_upper_bound=km_to_chord(max_distance_km))
+    distance, index = distance.reshape(len(lat), -1), index.reshape(len(lat), -1)
+    found = np.isfinite(distance)
+    n_found = found.sum(axis=1)
+    keep = n_found > 0
+    distance, index, found, n_found = distance[keep], index[keep], found[keep], n_found[keep]
+
+    # Inverse distance weights; neighbours beyond the maximum distance get weight 0
+    distance_km = chord_to_km(np.where(found, distance, 0))
+    weights = np.where(found, 1 / np.maximum(distance_km, 1e-6) ** power, 0)
+    values = np.einsum('nk,nkc->nc', weights, _known_values[np.where(found, index, 0)]) / weights.sum(axis=1)[:, None]
+
+    return (
+        lat[keep],
+        lon[keep],
+        values,
+        distance_km[:, 0],
+        np.where(found, distance_km, 0).sum(axis=1) / n_found,
+        n_found,
+    )
+
+
+def gap_fill(data, value_columns, resolution=DEFAULT_RESOLUTION, neighbours=DEFAULT_NEIGHBOURS, power=DEFAULT_POWER,
+             max_distance_km=DEFAULT_MAX_DISTANCE_KM, band=DEFAULT_BAND, workers=None, origin=None):
+    """Yield one DataFrame of filled cells per latitude band, in order from the north pole.
+
+    The filled cells lie on the grid with a cell centred on ``origin``, inferred from the
+    observed cells by default, and distances are measured from the observed cell centres.
+    Two observed cells in one grid cell raise a ValueError.
+    """
+    known = data[value_columns].notna().all(axis=1) & (data[value_columns] != 0).all(axis=1)
+    known_latitudes = data.loc[known, 'latitude'].to_numpy(dtype=float)
+    known_longitudes = data.loc[known, 'longitude'].to_numpy(dtype=float)
+    known_values = data.loc[known, value_columns].to_numpy(dtype=float)
+    if len(known_values) == 0:
+        raise ValueError(f"No observed cells with non-zero {', '.join(value_columns)} to fill from")
+
+    origin = origin or infer_grid_origin(known_latitudes, known_longitudes, resolution)
+    rows, cols = cell_rows_cols(known_latitudes, known_longitudes, resolution, origin)
+    check_unique_cells(rows, cols, int(round(360 / resolution)))
+    known_cells = np.sort(cell_index(known_latitudes, known_longitudes, resolution, origin))
+    known_latitudes, known_longitudes = snap_to_grid(known_latitudes, known_longitudes, resolution, origin)
+
+    # Bands of about ``band`` degrees of grid rows
+    latitudes, longitudes = grid_centres(resolution, origin)
+    rows_per_band = max(int(round(band / resolution)), 1)
+    tasks = [(latitudes[start:start + rows_per_band], longitudes, resolution, origin, neighbours, power, max_distance_km)
+             for start in range(0, len(latitudes), rows_per_band)]
+
+    # With fork the tree is built once here and shared copy-on-write by all workers;
+    # otherwise every spawned worker has to build its own copy
+    workers = workers or os.cpu_count()
+    initargs = (known_latitudes, known_longitudes, known_values, known_cells)
+    if 'fork' in multiprocessing.get_all_start_methods():
+        init_worker(*initargs)
+        pool = dict(mp_context=multiprocessing.get_context('fork'))
+    else:
+        pool = dict(initializer=init_worker, initargs=initargs)
+    with ProcessPoolExecutor(max_workers=workers, **pool) as executor:
+        # Only a couple of bands per worker are in flight, which bounds the memory held by finished results
+        window = 2 * workers
+        pending = deque(executor.submit(fill_band, task) for task in tasks[:window])
+        next_task = window
+        while pending:
+            lat, lon, values, nearest_km, mean_km, n_found = pending.popleft().result()
+            if next_task < len(tasks):
+                pending.append(executor.submit(fill_band, tasks[next_task]))
+                next_task += 1
+
+            filled = pd.DataFrame({'latitude': lat, 'longitude': lon})
+            for i, col in enumerate(value_columns):
+                filled[col] = values[:, i]
+            filled['filled'] = 1
+            filled['nearest_km'] = nearest_km
+            filled['mean_distance_km'] = mean_km
+            filled['n_neighbours'] = n_found
+            yield filled
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill empty cells of a sub-pixel ratio grid with distance-weighted KNN estimates.")
+    parser.add_argument('input_csv', type=str, help="Grid CSV with latitude, longitude and ratio columns (e.g. subpixel_resolutions.csv).")
+    parser.add_argument('output_csv', type=str, help="Output CSV with observed and filled cells.")
+    parser.add_argument('--value_columns', type=str, nargs='+', default=None, help="Ratio columns to fill (default: the '/si' mean columns, without _std, _err and _count).")
+    parser.add_argument('--resolution', type=float, default=DEFAULT_RESOLUTION, help="Grid cell size in degrees.")
+    parser.add_argument('--neighbours', '-k', type=int, default=DEFAULT_NEIGHBOURS, help="Number of nearest observed cells used.")
+    parser.add_argument('--power', type=float, default=DEFAULT_POWER, help="Inverse distance weighting exponent.")
+    parser.add_argument('--max_distance_km', type=float, default=DEFAULT_MAX_DISTANCE_KM, help="Only use observations within this distance.")
+    parser.add_argument('--grid_origin', type=float, nargs=2, default=None, metavar=('LAT', 'LON'), help="Centre of any one cell (default: inferred from the observed cells).")
+    parser.add_argument('--band', type=float, default=DEFAULT_BAND, help="Latitude band processed per task, in degrees.")
+    parser.add_argument('--workers', type=int, default=None, help="Number of worker processes (default: all cores).")
+
+    args = parser.parse_args()
+
+    data = pd.read_csv(args.input_csv)
+    means, companions = ratio_columns(data.columns)
+    value_columns = args.value_columns or means
+    # Counts and uncertainties are only known for observed cells; they are written empty for filled ones
+    companions = [col for col in companions if col not in value_columns]
+
+    # Observed cells first, with a zero distance layer, snapped to the centres of the filled cells
+    observed = data[data[value_columns].notna().all(axis=1) & (data[value_columns] != 0).all(axis=1)]
+    origin = args.grid_origin or infer_grid_origin(observed['latitude'], observed['longitude'], args.resolution)
+    observed = observed[['latitude', 'longitude'] + value_columns + companions].assign(filled=0, nearest_km=0.0, mean_distance_km=0.0, n_neighbours=0)
+    observed['latitude'], observed['longitude'] = snap_to_grid(observed['latitude'], observed['longitude'], args.resolution, origin)
+    observed.to_csv(args.output_csv, index=False)
+
+    # Bands are appended as they finish so that only one band is held in memory at a time
+    n_filled = 0
+    for filled in gap_fill(data, value_columns, args.resolution, args.neighbours, args.power, args.max_distance_km, args.band, args.workers, origin):
+        filled.reindex(columns=observed.columns).to_csv(args.output_csv, mode='a', header=False, index=False)
+        n_filled += len(filled)
+
+    print(f"{len(observed)} observed and {n_filled} filled cells saved to {args.output_csv}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+import os
+import sys
+import json
+import hashlib
+import argparse
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Common'))
+from lunar_common import footprint_vertices
+
+DEFAULT_BAND = 10  # Latitude band of a partition, in degrees
+DEFAULT_CHUNK_SIZE = 500000  # CSV rows converted at once
+KINDS = ('footprints', 'grid')  # Footprint rows (V0-V3 corners + ratios) and aggregated grid cells
+PARTITIONING = ds.partitioning(pa.schema([('lat_band', pa.int16()), ('date', pa.string())]), flavor='hive')
+
+
+def add_partition_columns(chunk, kind, date=None, band=DEFAULT_BAND):
+    """Add centre coordinates (footprints only), the latitude band and the acquisition date used as partition keys."""
+    if kind == 'footprints':
+        latitudes, longitudes = footprint_vertices(chunk)
+        chunk['centre_lat'] = latitudes.mean(axis=1)
+        chunk['centre_lon'] = (longitudes.mean(axis=1) + 180) % 360 - 180
+        lat = chunk['centre_lat']
+    else:
+        lat = chunk['latitude']
+
+    chunk['lat_band'] = (np.floor(lat.clip(-90, 90 - 1e-9) / band) * band).fillna(-999).astype(np.int16)
+    if date is not None:
+        chunk['date'] = date
+    elif 'date' in chunk:
+        chunk['date'] = pd.to_datetime(chunk['date']).dt.strftime('%Y-%m-%d')
+    else:
+        chunk['date'] = 'all'
+    return chunk
+
+
+def catalog_band(root, band=None):
+    """Latitude band width of a catalog, recorded in root/meta.json by the first ingest.
+
+    A new catalog is created with ``band`` (or the default); an existing one must match it.
+    """
+    meta_file = os.path.join(root, 'meta.json')
+    if os.path.exists(meta_file):
+        with open(meta_file) as f:
+            stored = json.load(f)['band']
+        if band is not None and band != stored:
+            raise ValueError(f"Catalog {root} is partitioned in {stored} degree bands, not {band}")
+        return stored
+    return band or DEFAULT_BAND
+
+
+def source_id(csv_file):
+    """Short id of a source CSV, from its absolute path, that prefixes the names of its Parquet parts."""
+    path = os.path.abspath(csv_file)
+    return f"{os.path.splitext(os.path.basename(path))[0]}-{hashlib.sha1(path.encode('utf-8')).hexdigest()[:12]}"
+
+
+def remove_source_parts(root, kind, source):
+    """Delete the Parquet parts written for one source id in every partition of root/kind."""
+    n_removed = 0
+    for folder, _, files in os.walk(os.path.join(root, kind)):
+        for name in files:
+            if name.startswith(source + '-') and name.endswith('.parquet'):
+                os.remove(os.path.join(folder, name))
+                n_removed += 1
+    return n_removed
+
+
+def ingest_csv(csv_file, root, kind, date=None, band=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Convert a CSV into Parquet files under root/kind, partitioned by latitude band and date.
+
+    Parts are named after a source id derived from the absolute path of the CSV. The parts a
+    previous ingest of the same file left in any partition are deleted first, so ingesting it
+    again replaces its rows, while files with the same name in other folders stay separate.
+    """
+    band = catalog_band(root, band)
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, 'meta.json'), 'w') as f:
+        json.dump({'band': band}, f)
+
+    source = source_id(csv_file)
+    remove_source_parts(root, kind, source)
+    n_rows = 0
+    for i, chunk in enumerate(pd.read_csv(csv_file, chunksize=chunk_size)):
+        chunk = add_partition_columns(chunk, kind, date, band)
+        ds.write_dataset(
+            pa.Table.from_pandas(chunk, preserve_index=False),
+            os.path.join(root, kind),
+            format='parquet',
+            partitioning=PARTITIONING,
+            basename_template=f'{source}-{i}-{{i}}.parquet',
+            existing_data_behavior='overwrite_or_ignore',
+        )
+        n_rows += len(chunk)
+    return n_rows
+
+
+def query(root, kind, columns=None, nonzero=None, lat_range=None, lon_range=None, date_range=None):
+    """Read rows of a catalog kind, pushing the column projection and predicates down to the Parquet reader.
+
+    ``nonzero`` lists columns that must be non-zero (e.g. ['mg/si_avg']), ``lat_range`` and
+    ``lon_range`` are (min, max) degrees on the cell or footprint centre and ``date_range`` is a
+    ('YYYY-MM-DD', 'YYYY-MM-DD') pair. Partitions outside the latitude or date range are never opened.
+    """
+    dataset = ds.dataset(os.path.join(root, kind), format='parquet', partitioning=PARTITIONING)
+    lat_col, lon_col = ('centre_lat', 'centre_lon') if kind == 'footprints' else ('latitude', 'longitude')
+
+    predicates = []
+    for col in nonzero or []:
+        predicates.append(ds.field(col) != 0)
+    if lat_range is not None:
+        band = catalog_band(root)
+        first_band, last_band = np.floor(np.array(lat_range, dtype=float) / band) * band
+        predicates.append((ds.field('lat_band') >= int(first_band)) & (ds.field('lat_band') <= int(last_band)))
+        predicates.append((ds.field(lat_col) >= lat_range[0]) & (ds.field(lat_col) <= lat_range[1]))
+    if lon_range is not None:
+        predicates.append((ds.field(lon_col) >= lon_range[0]) & (ds.field(lon_col) <= lon_range[1]))
+    if date_range is not None:
+        predicates.append((ds.field('date') >= date_range[0]) & (ds.field('date') <= date_range[1]))
+
+    condition = None
+    for predicate in predicates:
+        condition = predicate if condition is None else condition & predicate
+    return dataset.to_table(columns=columns, filter=condition).to_pandas()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Partitioned Parquet catalog of footprints, ratios and grid cells.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    ingest = subparsers.add_parser('ingest', help="Convert a CSV into the catalog.")
+    ingest.add_argument('csv_file', type=str, help="Footprint ratio CSV or grid CSV (e.g. subpixel_resolutions.csv).")
+    ingest.add_argument('root', type=str, help="Catalog directory.")
+    ingest.add_argument('--kind', choices=KINDS, required=True, help="'footprints' for V0-V3 rows, 'grid' for latitude/longitude cells.")
+    ingest.add_argument('--date', type=str, default=None, help="Acquisition date (YYYY-MM-DD) of all rows, if the CSV has no 'date' column.")
+    ingest.add_argument('--band', type=int, default=None, help=f"Latitude band of a partition in degrees, for a new catalog (default: {DEFAULT_BAND}).")
+
+    select = subparsers.add_parser('query', help="Select rows from the catalog.")
+    select.add_argument('root', type=str, help="Catalog directory.")
+    select.add_argument('--kind', choices=KINDS, required=True, help="Catalog kind to read.")
+    select.add_argument('--columns', type=str, nargs='+', default=None, help="Columns to read (default: all).")
+    select.add_argument('--nonzero', type=str, nargs='+', default=None, help="Only rows where these columns are not zero.")
+    select.add_argument('--lat', type=float, nargs=2, default=None, metavar=('MIN', 'MAX'), help="Latitude range in degrees.")
+    select.add_argument('--lon', type=float, nargs=2, default=None, metavar=('MIN', 'MAX'), help="Longitude range in degrees.")
+    select.add_argument('--dates', type=str, nargs=2, default=None, metavar=('FIRST', 'LAST'), help="Date range, YYYY-MM-DD.")
+    select.add_argument('--output', type=str, default=None, help="Write the rows to this CSV instead of printing a summary.")
+
+    args = parser.parse_args()
+
+    if args.command == 'ingest':
+        n_rows = ingest_csv(args.csv_file, args.root, args.kind, args.date, args.band)
+        print(f"{n_rows} rows of {args.csv_file} added to {os.path.join(args.root, args.kind)}")
+        return
+
+    rows = query(args.root, args.kind, args.columns, args.nonzero, args.lat, args.lon, args.dates)
+    if args.output:
+        rows.to_csv(args.output, index=False)
+        print(f"{len(rows)} rows saved to {args.output}")
+    else:
+        print(rows.head(20).to_string(index=False))
+        print(f"{len(rows)} rows")
+
+
+if __name__ == "__main__":
+    main()
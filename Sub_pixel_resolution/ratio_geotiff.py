@@ -0,0 +1,117 @@
+import os
+import sys
+import argparse
+import numpy as np
+import pandas as pd
+import rasterio
+import rasterio.shutil
+from rasterio.enums import Resampling
+from rasterio.windows import from_bounds
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Common'))
+from lunar_common import (
+    LUNAR_CRS, METRES_PER_DEGREE, cell_rows_cols, check_unique_cells, grid_layout, grid_transform, infer_grid_origin,
+)
+
+DEFAULT_RESOLUTION = 0.1  # Grid cell size in degrees
+DEFAULT_BLOCK_SIZE = 512  # Internal tile size of the COG
+
+
+def band_columns(columns):
+    """Pick the ratio mean, count and uncertainty columns of a grid CSV, in that order."""
+    lower = {col: col.lower() for col in columns}
+    ratios = [col for col in columns if '/si' in col and not lower[col].endswith(('_std', '_err', '_count'))]
+    counts = [col for col in columns if lower[col] == 'count' or lower[col].endswith('_count')]
+    uncertainties = [col for col in columns if lower[col].endswith(('_std', '_err'))]
+    return ratios + counts + uncertainties
+
+
+def csv_to_band(data, column, resolution, origin=None):
+    """Place one CSV column of cell centres into a global float32 grid, NaN where there is no cell.
+
+    Each row goes to the cell with the nearest centre; two rows in one cell raise a ValueError.
+    """
+    n_rows, n_cols, _, _ = grid_layout(resolution, origin)
+    band = np.full((n_rows, n_cols), np.nan, dtype=np.float32)
+    rows, cols = cell_rows_cols(data['latitude'], data['longitude'], resolution, origin)
+    check_unique_cells(rows, cols, n_cols)
+    band[rows, cols] = data[column].to_numpy(dtype=np.float32)
+    return band
+
+
+def write_cog(bands, resolution, output_file, block_size=DEFAULT_BLOCK_SIZE, origin=None):
+    """Write named global grids as one tiled, compressed, multi-band Cloud-Optimized GeoTIFF with overviews.
+
+    ``bands`` is a sequence of (name, array) pairs, or of (name, callable) pairs producing the
+    array, so that only one band needs to be held in memory at a time.
+    """
+    n_rows, n_cols, _, _ = grid_layout(resolution, origin)
+    temp_file = output_file + '.tmp.tif'
+    profile = dict(
+        driver='GTiff', height=n_rows, width=n_cols, count=len(bands), dtype='float32', nodata=np.nan,
+        crs=LUNAR_CRS.to_wkt(), transform=grid_transform(resolution, origin),
+        tiled=True, blockxsize=block_size, blockysize=block_size, compress='deflate', predictor=3, BIGTIFF='IF_SAFER',
+    )
+
+    # The COG driver can only copy an existing dataset, so the bands go through a tiled temporary GeoTIFF
+    try:
+        with rasterio.open(temp_file, 'w', **profile) as dst:
+            for i, (name, band) in enumerate(bands, start=1):
+                dst.write((band() if callable(band) else band).astype(np.float32), i)
+                dst.set_band_description(i, name)
+        rasterio.shutil.copy(
+            temp_file, output_file, driver='COG', compress='DEFLATE', predictor='FLOATING_POINT',
+            blocksize=block_size, overviews='AUTO', overview_resampling='AVERAGE', BIGTIFF='IF_SAFER',
+        )
+    finally:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+
+
+def read_ratio_window(tiff_file, band_name, lat_min=-90, lat_max=90, lon_min=-180, lon_max=180, max_size=None):
+    """Read one named band of a ratio GeoTIFF for a lat/lon box.
+
+    With ``max_size`` the window is decimated so that its longer side has at most that many
+    pixels, which lets GDAL serve it from the internal overviews. Returns the masked array and
+    the transform of the window, ready for ``rasterio.plot.show``.
+    """
+    with rasterio.open(tiff_file) as src:
+        band = list(src.descriptions).index(band_name) + 1
+        window = from_bounds(
+            lon_min * METRES_PER_DEGREE, lat_min * METRES_PER_DEGREE,
+            lon_max * METRES_PER_DEGREE, lat_max * METRES_PER_DEGREE,
+            transform=src.transform,
+        ).round_offsets().round_lengths()
+
+        out_shape = None
+        scale = 1.0
+        if max_size and max(window.width, window.height) > max_size:
+            scale = max(window.width, window.height) / max_size
+            out_shape = (max(int(window.height / scale), 1), max(int(window.width / scale), 1))
+
+        data = src.read(band, window=window, out_shape=out_shape, masked=True, resampling=Resampling.average)
+        transform = src.window_transform(window) * rasterio.Affine.scale(window.width / data.shape[1], window.height / data.shape[0])
+    return data, transform
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export aggregated ratio grids as a multi-band Cloud-Optimized GeoTIFF.")
+    parser.add_argument('input_csv', type=str, help="Grid CSV with latitude, longitude and ratio columns (e.g. subpixel_resolutions.csv).")
+    parser.add_argument('output_tiff', type=str, help="Output COG file.")
+    parser.add_argument('--columns', type=str, nargs='+', default=None, help="Columns to export (default: ratio means, counts and uncertainties).")
+    parser.add_argument('--resolution', type=float, default=DEFAULT_RESOLUTION, help="Grid cell size in degrees.")
+    parser.add_argument('--grid_origin', type=float, nargs=2, default=None, metavar=('LAT', 'LON'), help="Centre of any one cell (default: inferred from the input).")
+    parser.add_argument('--block_size', type=int, default=DEFAULT_BLOCK_SIZE, help="Tile size in pixels.")
+
+    args = parser.parse_args()
+
+    data = pd.read_csv(args.input_csv)
+    columns = args.columns or band_columns(data.columns)
+    origin = args.grid_origin or infer_grid_origin(data['latitude'], data['longitude'], args.resolution)
+    bands = [(col, lambda col=col: csv_to_band(data, col, args.resolution, origin)) for col in columns]
+    write_cog(bands, args.resolution, args.output_tiff, args.block_size, origin)
+    print(f"Bands {', '.join(columns)} saved to {args.output_tiff}")
+
+
+if __name__ == "__main__":
+    main()
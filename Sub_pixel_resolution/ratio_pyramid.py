@@ -0,0 +1,309 @@
+import os
+import sys
+import json
+import argparse
+import numpy as np
+import pandas as pd
+from numpy.lib.format import open_memmap
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Common'))
+from lunar_common import footprint_rings, footprint_spans, footprint_vertices, grid_shape, read_new_rows
+from ratio_geotiff import write_cog
+
+DEFAULT_RESOLUTION = 0.05  # Finest level kept in the store, in degrees
+DEFAULT_COLUMNS = ['mg/si', 'al/si', 'ca/si']
+DEFAULT_BATCH_SIZE = 20000  # Footprints rasterized at once
+ROW_BLOCK = 256  # Grid rows updated or rolled up at once
+ACCUMULATORS = ('sum', 'sumsq', 'count')
+VARIANCE_TOLERANCE = 1e-12  # Variances below this fraction of mean ** 2 are rounding error and set to 0
+
+
+def create_store(store_dir, resolution=DEFAULT_RESOLUTION, columns=DEFAULT_COLUMNS):
+    """Create an empty store: one (columns, rows, cols) float64 array per accumulator plus meta.json."""
+    os.makedirs(store_dir, exist_ok=True)
+    n_rows, n_cols = grid_shape(resolution)
+    for name in ACCUMULATORS:
+        open_memmap(os.path.join(store_dir, f'{name}.npy'), mode='w+', dtype=np.float64, shape=(len(columns), n_rows, n_cols)).flush()
+    save_meta(store_dir, {'resolution': resolution, 'columns': list(columns), 'sources': {}, 'published': []})
+
+
+def load_meta(store_dir):
+    """Read the store metadata: resolution, columns, catalog read offsets and digests, and published outputs."""
+    with open(os.path.join(store_dir, 'meta.json')) as f:
+        meta = json.load(f)
+    meta.setdefault('sources', {})
+    meta.setdefault('published', [])
+    return meta
+
+
+def save_meta(store_dir, meta):
+    """Replace meta.json in one step so that an interrupted run never leaves it half written."""
+    temp_file = os.path.join(store_dir, 'meta.json.tmp')
+    with open(temp_file, 'w') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(temp_file, os.path.join(store_dir, 'meta.json'))
+
+
+def open_store(store_dir, mode='r'):
+    """Return the store metadata and its accumulators as memory-mapped arrays."""
+    meta = load_meta(store_dir)
+    arrays = {name: np.load(os.path.join(store_dir, f'{name}.npy'), mmap_mode=mode) for name in ACCUMULATORS}
+    return meta, arrays
+
+
+def add_spans(target, rows, first, last, weights):
+    """Add ``weights`` to the runs of cells [first, last] of each row.
+
+    Work is done one block of rows at a time and only over the columns the runs touch, so a
+    small batch of footprints only reads and writes a small part of the memory-mapped grid.
+    """
+    order = np.argsort(rows, kind='stable')
+    rows, first, last, weights = rows[order], first[order], last[order], weights[order]
+
+    for row0 in range(0, target.shape[0], ROW_BLOCK):
+        lo, hi = np.searchsorted(rows, [row0, row0 + ROW_BLOCK])
+        if lo == hi:
+            continue
+        n_block = min(ROW_BLOCK, target.shape[0] - row0)
+        col0, col1 = first[lo:hi].min(), last[lo:hi].max() + 1
+        width = col1 - col0 + 1  # One spare column for the end markers of the difference array
+        offset = (rows[lo:hi] - row0) * width - col0
+        diff = np.bincount(offset + first[lo:hi], weights=weights[lo:hi], minlength=n_block * width)
+        diff -= np.bincount(offset + last[lo:hi] + 1, weights=weights[lo:hi], minlength=n_block * width)
+        target[row0:row0 + n_block, col0:col1] += np.cumsum(diff.reshape(n_block, width), axis=1)[:, :-1]
+
+
+def accumulate(store_dir, table, sign=1, batch_size=DEFAULT_BATCH_SIZE):
+    """Add (sign=1) or remove (sign=-1) the ratios of footprint rows to every cell whose centre they cover.
+
+    Zero or missing ratios are treated as non-detections and skipped for that column,
+    as in csv_filteration.py.
+    """
+    meta, arrays = open_store(store_dir, mode='r+')
+    resolution = meta['resolution']
+
+    ring_lat, ring_lon = footprint_rings(*footprint_vertices(table))
+    values = table[meta['columns']].to_numpy(dtype=float)
+
+    # Rows without complete coordinates cannot be placed on the grid
+    placed = np.isfinite(ring_lat).all(axis=1) & np.isfinite(ring_lon).all(axis=1)
+    ring_lat, ring_lon, values = ring_lat[placed], ring_lon[placed], values[placed]
+
+    for start in range(0, len(ring_lat), batch_size):
+        stop = start + batch_size
+        owner, rows, first, last = footprint_spans(ring_lat[start:stop], ring_lon[start:stop], resolution)
+        batch_values = values[start:stop][owner]
+        for c in range(len(meta['columns'])):
+            v = batch_values[:, c]
+            valid = np.isfinite(v) & (v != 0)
+            args = (rows[valid], first[valid], last[valid])
+            add_spans(arrays['sum'][c], *args, sign * v[valid])
+            add_spans(arrays['sumsq'][c], *args, sign * v[valid] ** 2)
+            add_spans(arrays['count'][c], *args, np.full(valid.sum(), float(sign)))
+
+    for array in arrays.values():
+        array.flush()
+
+
+def add_catalog(store_dir, csv_file):
+    """Fold in the rows appended to a catalog CSV since it was last added; only the new bytes are parsed.
+
+    A catalog that was rewritten since it was last added is an error: its old rows are
+    already in the store, and only ``replace`` can swap them for the new ones.
+    """
+    meta = load_meta(store_dir)
+    source = os.path.abspath(csv_file)
+    state = meta['sources'].get(source, {'offset': 0, 'digest': None})
+    if not isinstance(state, dict):  # Stores written before the digest was kept hold only the offset
+        state = {'offset': state, 'digest': None}
+    try:
+        table, offset, digest = read_new_rows(csv_file, state['offset'], state['digest'])
+    except ValueError as error:
+        raise ValueError(f"{error}. Use 'replace' with the previous version to swap its rows.") from None
+    accumulate(store_dir, table)
+
+    meta['sources'][source] = {'offset': offset, 'digest': digest}
+    save_meta(store_dir, meta)
+    print(f"Added {len(table)} footprints from {csv_file} to {store_dir}")
+
+
+def retract_catalog(store_dir, csv_file):
+    """Remove the contribution of every row of a CSV, e.g. the previous version of a reprocessed file."""
+    table = pd.read_csv(csv_file)
+    accumulate(store_dir, table, sign=-1)
+
+    # A retracted catalog is no longer tracked; adding it again starts from its first row
+    meta = load_meta(store_dir)
+    meta['sources'].pop(os.path.abspath(csv_file), None)
+    save_meta(store_dir, meta)
+    print(f"Retracted {len(table)} footprints of {csv_file} from {store_dir}")
+
+
+def replace_catalog(store_dir, old_csv, new_csv):
+    """Swap the rows of a reprocessed file: retract the old version, then add the new one."""
+    retract_catalog(store_dir, old_csv)
+    meta = load_meta(store_dir)
+    meta['sources'].pop(os.path.abspath(new_csv), None)
+    save_meta(store_dir, meta)
+    add_catalog(store_dir, new_csv)
+
+
+def level(store_dir, resolution, equal_area=False):
+    """Roll the finest level up to ``resolution`` and return (meta, mean, std, count) arrays.
+
+    Every footprint adds one sample to each fine cell it covers, and a coarse cell pools the
+    samples of its fine cells. Its count is therefore the number of fine-cell samples, not
+    of footprints: a footprint covering 100 fine cells of the block counts 100 times. The
+    mean and standard deviation are those of the samples, so a footprint weighs in by the
+    number of fine cells it covers. Only at the store resolution are they per footprint.
+
+    With ``equal_area`` the coarse mean is the mean of the observed fine cells of the block,
+    each weighted by its area (cos latitude) instead of by its number of samples, so a
+    heavily revisited part of a coarse cell counts only as much as the area it covers. It
+    does not weight coarse cells against each other, and the standard deviation and count
+    are still those of the samples.
+
+    The levels are computed one block of rows at a time, so besides the three output arrays
+    only one block of the store is held in memory.
+    """
+    meta, arrays = open_store(store_dir)
+    factor = resolution / meta['resolution']
+    n_rows, n_cols = grid_shape(meta['resolution'])
+    if not np.isclose(factor, round(factor)) or n_rows % round(factor) or n_cols % round(factor):
+        raise ValueError(f"{resolution} deg is not a whole multiple of the store resolution {meta['resolution']} deg dividing the grid")
+    factor = int(round(factor))
+
+    n_values = len(meta['columns'])
+    shape = (n_values, n_rows // factor, n_cols // factor)
+    mean, std, count = np.empty(shape), np.empty(shape), np.empty(shape)
+    block = max(ROW_BLOCK // factor, 1) * factor
+
+    def roll_up(fine):
+        return fine.reshape(n_values, -1, factor, n_cols // factor, factor).sum(axis=(2, 4))
+
+    for row0 in range(0, n_rows, block):
+        rows = slice(row0, row0 + block)
+        out = slice(row0 // factor, (row0 + block) // factor)
+        fine_count = np.asarray(arrays['count'][:, rows])
+        fine_sum = np.asarray(arrays['sum'][:, rows])
+        block_count = roll_up(fine_count)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            block_mean = roll_up(fine_sum) / block_count
+            variance = roll_up(np.asarray(arrays['sumsq'][:, rows])) / block_count - block_mean ** 2
+            # Equal samples (e.g. a single one) leave only rounding error of sumsq / count - mean ** 2
+            variance[variance <= VARIANCE_TOLERANCE * block_mean ** 2] = 0
+
+            if equal_area:
+                lat = 90 - (np.arange(row0, row0 + fine_count.shape[1]) + 0.5) * meta['resolution']
+                area = np.where(fine_count > 0, np.cos(np.radians(lat))[None, :, None], 0)
+                fine_mean = np.divide(fine_sum, fine_count, out=np.zeros_like(fine_sum), where=fine_count > 0)
+                block_mean = roll_up(area * fine_mean) / roll_up(area)
+
+        mean[:, out], std[:, out], count[:, out] = block_mean, np.sqrt(variance), block_count
+    return meta, mean, std, count
+
+
+def level_table(meta, mean, std, count, resolution):
+    """Cells with at least one observation as a DataFrame in the sub-pixel CSV layout (latitude, longitude, mg/si_avg, ...)."""
+    has_data = (count > 0).any(axis=0)
+    rows, cols = np.nonzero(has_data)
+    table = pd.DataFrame({
+        'latitude': 90 - (rows + 0.5) * resolution,
+        'longitude': -180 + (cols + 0.5) * resolution,
+    })
+    for c, col in enumerate(meta['columns']):
+        table[f'{col}_avg'] = np.nan_to_num(mean[c, rows, cols])  # 0 marks cells without data, as before
+        table[f'{col}_std'] = np.nan_to_num(std[c, rows, cols])
+        table[f'{col}_count'] = count[c, rows, cols].astype(np.int64)
+    return table
+
+
+def publish(store_dir, resolution, equal_area=False, output=None, geotiff=None):
+    """Write one level as CSV and/or COG and remember it so that refresh() can regenerate it.
+
+    The targets are stored as absolute paths, so refresh() writes to the same files from any directory.
+    """
+    output = output and os.path.abspath(output)
+    geotiff = geotiff and os.path.abspath(geotiff)
+    meta, mean, std, count = level(store_dir, resolution, equal_area)
+    if output:
+        table = level_table(meta, mean, std, count, resolution)
+        table.to_csv(output, index=False)
+        print(f"{len(table)} cells at {resolution} deg saved to {output}")
+    if geotiff:
+        bands = [(f'{col}_avg', mean[c]) for c, col in enumerate(meta['columns'])]
+        bands += [(f'{col}_count', count[c]) for c, col in enumerate(meta['columns'])]
+        bands += [(f'{col}_std', std[c]) for c, col in enumerate(meta['columns'])]
+        write_cog(bands, resolution, geotiff)
+        print(f"Bands {', '.join(name for name, _ in bands)} saved to {geotiff}")
+
+    target = {'resolution': resolution, 'equal_area': equal_area, 'output': output, 'geotiff': geotiff}
+    meta = load_meta(store_dir)
+    if target not in meta['published']:
+        meta['published'].append(target)
+        save_meta(store_dir, meta)
+
+
+def refresh(store_dir):
+    """Regenerate every published map from the current accumulators."""
+    for target in load_meta(store_dir)['published']:
+        publish(store_dir, **target)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-resolution ratio aggregation with exact roll-up between levels.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build = subparsers.add_parser('build', help="Aggregate a footprint ratio CSV into a new store at the finest resolution.")
+    build.add_argument('csv_file', type=str, help="Footprint CSV with V0-V3 coordinates and ratio columns.")
+    build.add_argument('store_dir', type=str, help="Directory of the aggregation store.")
+    build.add_argument('--resolution', type=float, default=DEFAULT_RESOLUTION, help="Finest grid cell size in degrees.")
+    build.add_argument('--columns', type=str, nargs='+', default=DEFAULT_COLUMNS, help="Ratio columns to aggregate.")
+
+    query = subparsers.add_parser('level', help="Derive one resolution level from the store.")
+    query.add_argument('store_dir', type=str, help="Directory of the aggregation store.")
+    query.add_argument('--resolution', type=float, required=True, help="Grid cell size in degrees, a multiple of the store resolution.")
+    query.add_argument('--equal_area', action='store_true', help="Weight fine cells by area instead of by number of samples.")
+    query.add_argument('--output', type=str, default=None, help="Write the cells with data to this CSV.")
+    query.add_argument('--geotiff', type=str, default=None, help="Write mean, count and std bands to this COG.")
+
+    add = subparsers.add_parser('add', help="Fold in the rows appended to a catalog CSV since it was last added.")
+    add.add_argument('csv_file', type=str, help="Footprint CSV with V0-V3 coordinates and ratio columns.")
+    add.add_argument('store_dir', type=str, help="Directory of the aggregation store.")
+
+    retract = subparsers.add_parser('retract', help="Remove the contribution of the rows of a CSV.")
+    retract.add_argument('csv_file', type=str, help="CSV holding exactly the rows to remove.")
+    retract.add_argument('store_dir', type=str, help="Directory of the aggregation store.")
+
+    replace = subparsers.add_parser('replace', help="Retract the old version of a reprocessed file and add the new one.")
+    replace.add_argument('old_csv', type=str, help="Previous version of the file, as it was added.")
+    replace.add_argument('new_csv', type=str, help="Reprocessed version of the file.")
+    replace.add_argument('store_dir', type=str, help="Directory of the aggregation store.")
+
+    for command in (add, retract, replace):
+        command.add_argument('--refresh', action='store_true', help="Regenerate the published maps afterwards.")
+
+    update = subparsers.add_parser('refresh', help="Regenerate every published map from the store.")
+    update.add_argument('store_dir', type=str, help="Directory of the aggregation store.")
+
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        create_store(args.store_dir, args.resolution, args.columns)
+        add_catalog(args.store_dir, args.csv_file)
+    elif args.command == 'level':
+        publish(args.store_dir, args.resolution, args.equal_area, args.output, args.geotiff)
+    elif args.command == 'add':
+        add_catalog(args.store_dir, args.csv_file)
+    elif args.command == 'retract':
+        retract_catalog(args.store_dir, args.csv_file)
+    elif args.command == 'replace':
+        replace_catalog(args.store_dir, args.old_csv, args.new_csv)
+
+    if args.command == 'refresh' or getattr(args, 'refresh', False):
+        refresh(args.store_dir)
+
+
+if __name__ == "__main__":
+    main()
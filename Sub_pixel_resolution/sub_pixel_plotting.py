@@ -1,12 +1,14 @@
 import os
+import numpy as np
 import pandas as pd
 import rasterio
 from rasterio.plot import show
-from shapely.geometry import Polygon
+import shapely
 import geopandas as gpd
 import matplotlib.pyplot as plt
 from matplotlib.colors import Normalize
 from matplotlib.cm import ScalarMappable
+from ratio_geotiff import read_ratio_window
 
 # Set environment variable to ignore celestial body mismatches
 os.environ["PROJ_IGNORE_CELESTIAL_BODY"] = "YES"
@@ -29,48 +31,53 @@ with rasterio.open(tiff_file) as src:
     ax.set_xticklabels([f"{x:.0f}" for x in x_labels])
     ax.set_yticklabels([f"{y:.0f}" for y in y_labels])
 
-# Load the CSV file
+# Load the ratio grid, either from a ratio GeoTIFF written by ratio_geotiff.py, a catalog written by ratio_catalog.py or the CSV file
+ratio_tiff = None  # Set to the ratio GeoTIFF path to read the grid as a raster instead of building polygons
+catalog_root = None  # Set to the catalog directory to read only the non-zero cells instead of the CSV file
 csv_file = r"D:\subpixelmap\filtered_subpixel_resolutions.csv"  # Replace with your CSV file path
-data = pd.read_csv(csv_file)
 
-# Create polygons for grid cells based on the CSV data
-polygons = []
-values = []
-half_size = 0.05  # Half of the 0.1° grid
+if ratio_tiff:
+    # Windowed read of the whole Moon, decimated through the internal overviews
+    ratio, ratio_transform = read_ratio_window(ratio_tiff, 'mg/si_avg', max_size=4000)
+    ratio = np.ma.masked_equal(ratio, 0)  # Skip grid cells with zero values
+    values = ratio.compressed()
+else:
+    if catalog_root:
+        # Only the three needed columns of the non-zero cells are read
+        from ratio_catalog import query
+        data = query(catalog_root, 'grid', columns=['latitude', 'longitude', 'mg/si_avg'], nonzero=['mg/si_avg'])
+    else:
+        data = pd.read_csv(csv_file)
+
+    # Create polygons for grid cells based on the CSV data
+    half_size = 0.05  # Half of the 0.1° grid
 
-for _, row in data.iterrows():
-    lat, lon = row['latitude'], row['longitude']
-    value = row['mg/si_avg']
-    
     # Skip grid cells with zero values
-    if value == 0:
-        continue
-
-    # Define corners of the square based on the center
-    corners = [
-        (lon - half_size, lat - half_size),
-        (lon + half_size, lat - half_size),
-        (lon + half_size, lat + half_size),
-        (lon - half_size, lat + half_size),
-    ]
-    polygon = Polygon(corners)
-    polygons.append(polygon)
-    values.append(value)
-
-# Create a GeoDataFrame for the polygons
-gdf = gpd.GeoDataFrame({'value': values, 'geometry': polygons}, crs="EPSG:4326")
-
-# Reproject the GeoDataFrame to match the GeoTIFF CRS, if needed
-if geotiff_crs != gdf.crs:
-    gdf = gdf.to_crs(geotiff_crs)
+    data = data[data['mg/si_avg'] != 0]
+    lat = data['latitude'].to_numpy(dtype=float)
+    lon = data['longitude'].to_numpy(dtype=float)
+    values = data['mg/si_avg'].to_numpy(dtype=float)
+
+    # Define the squares around all cell centres at once
+    polygons = shapely.box(lon - half_size, lat - half_size, lon + half_size, lat + half_size)
+
+    # Create a GeoDataFrame for the polygons
+    gdf = gpd.GeoDataFrame({'value': values, 'geometry': polygons}, crs="EPSG:4326")
+
+    # Reproject the GeoDataFrame to match the GeoTIFF CRS, if needed
+    if geotiff_crs != gdf.crs:
+        gdf = gdf.to_crs(geotiff_crs)
 
 # Normalize values for coloring
 norm = Normalize(vmin=min(values), vmax=max(values)- 0.1)
 cmap = plt.cm.autumn_r
 
-# Plot polygons on the GeoTIFF map
-gdf.plot(ax=ax, column='value', cmap=cmap, alpha=0.5, legend=False,
-         norm=norm, edgecolor=None)
+# Plot the grid cells on the GeoTIFF map
+if ratio_tiff:
+    show(ratio, transform=ratio_transform, ax=ax, cmap=cmap, norm=norm, alpha=0.5)
+else:
+    gdf.plot(ax=ax, column='value', cmap=cmap, alpha=0.5, legend=False,
+             norm=norm, edgecolor=None)
 
 # Add a colorbar
 sm = ScalarMappable(cmap=cmap, norm=norm)